@@ -0,0 +1,213 @@
+import asyncio
+from contextlib import aclosing
+from datetime import datetime, timedelta, timezone
+from typing import Any, Coroutine, Optional
+from uuid import uuid4
+from app.config import settings, logger
+from app.core.ratelimit import TokenBucket
+from app.db import crud
+from app.models import Announcement, User, UserPublic
+from app.outbox import SMTPConnection, build_message, email_deliveries
+from app.utils import render_email_template, send_email
+
+
+_tasks: set[asyncio.Task] = set()
+
+# identifies this process as the runner of the announcements it delivers
+RUNNER_ID = uuid4().hex
+
+_sent = email_deliveries.labels("announcement", "sent")
+# handed over to the outbox after a failed direct send
+_deferred = email_deliveries.labels("announcement", "deferred")
+_failed = email_deliveries.labels("announcement", "failed")
+
+
+class LeaseLost(Exception):
+    """
+    The announcement is no longer running under this process' lease
+    """
+
+
+def _lease_until() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=settings.ANNOUNCEMENT_LEASE_SECONDS)
+
+
+def _spawn(coro: Coroutine[Any, Any, None]) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def start_announcement(announcement: Announcement) -> asyncio.Task:
+    """
+    Insert an announcement leased to this process and deliver it in the background
+    """
+    announcement.runner_id = RUNNER_ID
+    announcement.lease_until = _lease_until()
+    await announcement.insert()
+    return _spawn(run_announcement(announcement))
+
+
+def start_interrupted_sweep() -> None:
+    """
+    Check for interrupted announcements now and then every ANNOUNCEMENT_LEASE_SECONDS
+    """
+    _spawn(_sweep_interrupted())
+
+
+async def stop_announcements() -> None:
+    for task in list(_tasks):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+
+
+async def _send(connection: SMTPConnection, limiter: TokenBucket, announcement: Announcement, user: UserPublic) -> None:
+    try:
+        html_content = await render_email_template(
+            template_name="announcement.html",
+            context={
+                "project_name": settings.PROJECT_NAME,
+                "message": announcement.message,
+                "username": user.full_name or user.email,
+                "email": user.email,
+            },
+        )
+    except Exception:
+        logger.exception(f"Announcement {announcement.id} to {user.email} could not be rendered")
+        announcement.failed += 1
+        _failed.inc()
+        return
+    try:
+        await limiter.acquire()
+        message = build_message(email_to=user.email, subject=announcement.subject, html_content=html_content)
+        await asyncio.to_thread(connection.send, message)
+    except Exception as e:
+        logger.warning(f"Announcement {announcement.id} to {user.email} failed, handing over to the outbox: {e!r}")
+        try:
+            await send_email(email_to=user.email, subject=announcement.subject, html_content=html_content)
+        except Exception:
+            logger.exception(f"Announcement {announcement.id} to {user.email} could not be queued")
+            announcement.failed += 1
+            _failed.inc()
+        else:
+            announcement.deferred += 1
+            _deferred.inc()
+    else:
+        announcement.sent += 1
+        _sent.inc()
+
+
+async def _sender(queue: asyncio.Queue[Optional[UserPublic]], limiter: TokenBucket, announcement: Announcement) -> None:
+    connection = SMTPConnection()
+    try:
+        while (user := await queue.get()) is not None:
+            await _send(connection, limiter, announcement, user)
+    finally:
+        await asyncio.to_thread(connection.close)
+
+
+async def _producer(queue: asyncio.Queue[Optional[UserPublic]], senders: int, announcement: Announcement) -> None:
+    batches = crud.iter_users_public(announcement.filter, batch_size=settings.ANNOUNCEMENT_BATCH_SIZE)
+    async with aclosing(batches):
+        async for batch in batches:
+            for user in batch:
+                await queue.put(user)
+            await announcement.set(
+                {"sent": announcement.sent, "deferred": announcement.deferred, "failed": announcement.failed}
+            )
+    for _ in range(senders):
+        await queue.put(None)
+
+
+async def _renew_lease(announcement: Announcement) -> None:
+    """
+    Extend the lease every third of ANNOUNCEMENT_LEASE_SECONDS while the delivery runs
+    """
+    while True:
+        await asyncio.sleep(settings.ANNOUNCEMENT_LEASE_SECONDS / 3)
+        result = await Announcement.find_one(
+            Announcement.id == announcement.id,
+            Announcement.runner_id == RUNNER_ID,
+            Announcement.status == "running",
+        ).update({"$set": {"lease_until": _lease_until()}})
+        if result is None or not result.modified_count:
+            raise LeaseLost(f"Announcement {announcement.id} is no longer leased to this process")
+
+
+async def run_announcement(announcement: Announcement) -> None:
+    """
+    Email the announcement to every user matching its filter.
+
+    Recipients are streamed from a cursor into a bounded queue drained by
+    ANNOUNCEMENT_SMTP_CONNECTIONS senders, each with its own persistent SMTP connection,
+    sharing one token bucket of ANNOUNCEMENT_RATE_PER_SECOND. Progress is saved after
+    every cursor batch. The producer and the senders run in one task group, so if any
+    of them fails the others are cancelled instead of waiting on the queue forever.
+
+    The announcement must be leased to this process, see start_announcement; the lease
+    is renewed alongside, and delivery stops if it was lost, e.g. to a process that
+    found it expired. The outcome is only saved while the lease is held.
+    """
+    limiter = TokenBucket(settings.ANNOUNCEMENT_RATE_PER_SECOND)
+    queue: asyncio.Queue[Optional[UserPublic]] = asyncio.Queue(maxsize=settings.ANNOUNCEMENT_BATCH_SIZE)
+    update: dict[str, Any] = {}
+    try:
+        total, _ = await crud.count_documents(User, crud.users_filter_query(announcement.filter))
+        await announcement.set({"total": total})
+        async with asyncio.TaskGroup() as tasks:
+            lease = tasks.create_task(_renew_lease(announcement))
+            delivery = [tasks.create_task(_producer(queue, settings.ANNOUNCEMENT_SMTP_CONNECTIONS, announcement))]
+            for _ in range(settings.ANNOUNCEMENT_SMTP_CONNECTIONS):
+                delivery.append(tasks.create_task(_sender(queue, limiter, announcement)))
+            # a failed task cancels this wait through the task group
+            await asyncio.wait(delivery)
+            lease.cancel()
+        update["status"] = "done"
+    except asyncio.CancelledError:
+        update["status"] = "cancelled"
+        raise
+    except Exception as e:
+        logger.exception(f"Announcement {announcement.id} failed")
+        # the task group wraps the failures of its tasks
+        error = e.exceptions[0] if isinstance(e, ExceptionGroup) else e
+        update.update(status="failed", error=repr(error))
+    finally:
+        update.update(
+            sent=announcement.sent,
+            deferred=announcement.deferred,
+            failed=announcement.failed,
+            finished_at=datetime.now(timezone.utc),
+        )
+        await Announcement.find_one(
+            Announcement.id == announcement.id,
+            Announcement.runner_id == RUNNER_ID,
+            Announcement.status == "running",
+        ).update({"$set": update})
+
+
+async def fail_interrupted_announcements() -> int:
+    """
+    Mark running announcements whose lease expired as failed; returns how many.
+
+    A running announcement's process renews its lease well before it expires, so an
+    expired one lost its process mid-delivery and will never finish. Announcements
+    that other live processes are delivering keep their lease and are left alone.
+    """
+    now = datetime.now(timezone.utc)
+    result = await Announcement.find(
+        Announcement.status == "running", {"lease_until": {"$not": {"$gte": now}}}
+    ).update({"$set": {"status": "failed", "error": "Interrupted, its process stopped", "finished_at": now}})
+    interrupted = result.modified_count if result is not None else 0
+    if interrupted:
+        logger.warning(f"{interrupted} interrupted announcement(s) marked failed")
+    return interrupted
+
+
+async def _sweep_interrupted() -> None:
+    while True:
+        try:
+            await fail_interrupted_announcements()
+        except Exception:
+            logger.exception("Checking for interrupted announcements failed")
+        await asyncio.sleep(settings.ANNOUNCEMENT_LEASE_SECONDS)
@@ -4,12 +4,14 @@ from beanie import PydanticObjectId
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import ValidationError
-from typing import Annotated
+from typing import Annotated, Optional
 from motor.motor_asyncio import AsyncIOMotorClientSession
 from app.config import settings
 from app.core import security
+from app.core.cache import principal_cache
 from app.db import get_session, crud
-from app.models import User, TokenPayload
+from app.models import User, UserPublic, TokenPayload
+from app.utils import decode_cursor
 
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -20,18 +22,105 @@ SessionDep = Annotated[AsyncIOMotorClientSession, Depends(get_session)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-async def get_current_user(session: SessionDep, token: TokenDep) -> User:
+async def get_cursor(cursor: Optional[str] = None) -> Optional[PydanticObjectId]:
+    """
+    Decode the next_cursor of a previous page into the last _id it returned.
+    """
+    if cursor is None:
+        return None
+    values = await decode_cursor(cursor)
+    if not values or len(values) != 1 or not PydanticObjectId.is_valid(values[0]):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return PydanticObjectId(values[0])
+
+
+CursorDep = Annotated[Optional[PydanticObjectId], Depends(get_cursor)]
+
+
+async def get_cursor_values(cursor: Optional[str] = None) -> Optional[list[str]]:
+    """
+    Decode the next_cursor of a previous page into the sort key values of its last row.
+    """
+    if cursor is None:
+        return None
+    values = await decode_cursor(cursor)
+    if not values:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+CursorValuesDep = Annotated[Optional[list[str]], Depends(get_cursor_values)]
+
+
+async def get_search_cursor(cursor: Optional[str] = None) -> Optional[tuple[float, PydanticObjectId]]:
+    """
+    Decode the next_cursor of a previous search page into its last (score, _id).
+    """
+    if cursor is None:
+        return None
+    values = await decode_cursor(cursor)
+    if not values or len(values) != 2 or not PydanticObjectId.is_valid(values[1]):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        score = float(values[0])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return score, PydanticObjectId(values[1])
+
+
+SearchCursorDep = Annotated[Optional[tuple[float, PydanticObjectId]], Depends(get_search_cursor)]
+
+
+async def get_token_subject(token: TokenDep) -> str:
+    """
+    Id of the user the access token was issued to.
+    """
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        token_data = TokenPayload(**payload)
+        sub = TokenPayload(**payload).sub
     except (InvalidTokenError, ValidationError):
+        sub = None
+    if sub is None or not PydanticObjectId.is_valid(sub):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = await crud.read_user_by_id(session=session, id=PydanticObjectId(token_data.sub))
+    return sub
+
+
+TokenSubjectDep = Annotated[str, Depends(get_token_subject)]
+
+
+async def get_current_principal(sub: TokenSubjectDep) -> UserPublic:
+    """
+    Snapshot of the authenticated user, served from principal_cache when possible.
+    """
+    principal = principal_cache.get(sub) if settings.PRINCIPAL_CACHE_ENABLED else None
+    if principal is None:
+        version = principal_cache.version
+        principal = await crud.read_user_public(session=None, id=PydanticObjectId(sub))
+        if not principal:
+            raise HTTPException(status_code=404, detail="User not found")
+        if settings.PRINCIPAL_CACHE_ENABLED:
+            principal_cache.set(sub, principal, version=version)
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
+
+
+CurrentPrincipal = Annotated[UserPublic, Depends(get_current_principal)]
+
+
+async def get_current_user(sub: TokenSubjectDep) -> User:
+    """
+    Full user document, for endpoints that modify the user or read private fields.
+
+    Read straight from the database in one round trip, the principal cache has no
+    use here since the document is needed anyway.
+    """
+    user = await User.get(PydanticObjectId(sub))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -42,9 +131,9 @@ async def get_current_user(session: SessionDep, token: TokenDep) -> User:
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
-async def get_current_active_superuser(current_user: CurrentUser) -> User:
-    if not current_user.is_superuser:
+async def get_current_active_superuser(principal: CurrentPrincipal) -> UserPublic:
+    if not principal.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
         )
-    return current_user
+    return principal
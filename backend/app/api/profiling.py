@@ -0,0 +1,137 @@
+import os
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import uuid4
+from fastapi import HTTPException
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+from pyinstrument.session import Session
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.api.deps import get_current_principal, get_token_subject
+from app.config import settings
+from app.models import ProfileSummary
+
+
+class ProfileStore:
+    """
+    Ring buffer of the latest max_profiles request profiles, in this process.
+
+    Only touched from the event loop thread.
+    """
+    def __init__(self, max_profiles: int) -> None:
+        self._profiles: deque[tuple[ProfileSummary, Session]] = deque(maxlen=max_profiles)
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def add(self, summary: ProfileSummary, session: Session) -> None:
+        self._profiles.append((summary, session))
+
+    def list(self) -> list[ProfileSummary]:
+        return [summary for summary, _ in reversed(self._profiles)]
+
+    def get(self, id: str) -> Optional[tuple[ProfileSummary, Session]]:
+        return next((profile for profile in self._profiles if profile[0].id == id), None)
+
+    def clear(self) -> None:
+        self._profiles.clear()
+
+
+profile_store = ProfileStore(max_profiles=settings.PROFILE_MAX_PROFILES)
+
+
+def render_speedscope(session: Session) -> str:
+    return SpeedscopeRenderer().render(session)
+
+
+def render_collapsed(session: Session) -> str:
+    """
+    One "frame;frame;frame microseconds" line per distinct stack, the input format of
+    flamegraph.pl and most flame graph viewers
+    """
+    stacks: defaultdict[str, float] = defaultdict(float)
+    for call_stack, seconds in session.frame_records:
+        frames = []
+        for identifier in call_stack:
+            # "function\x00file\x00line", then attributes after \x01
+            function, file, line = (identifier.split("\x01", 1)[0].split("\x00") + ["", ""])[:3]
+            frames.append(f"{function} ({os.path.basename(file)}:{line})" if file else function)
+        stacks[";".join(frames)] += seconds
+    return "".join(f"{stack} {round(seconds * 1_000_000)}\n" for stack, seconds in stacks.items())
+
+
+def _header(scope: Scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+async def _is_superuser(scope: Scope) -> bool:
+    authorization = _header(scope, b"authorization")
+    if authorization is None:
+        return False
+    scheme, _, token = authorization.decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        principal = await get_current_principal(await get_token_subject(token))
+    except HTTPException:
+        return False
+    return principal.is_superuser
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware running a request under pyinstrument when a superuser sends
+    X-Profile: 1.
+
+    The profiler samples the request's own async context, so the call tree covers
+    dependencies, crud calls and response serialization, with time spent awaiting the
+    database shown as await frames. The profile goes to profile_store and its id is
+    returned in the X-Profile-Id response header. Other requests pay for one header
+    lookup; X-Profile from anyone else is ignored.
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or _header(scope, b"x-profile") in (None, b"", b"0")
+            or not await _is_superuser(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid4().hex
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        profiler = Profiler(interval=settings.PROFILE_INTERVAL_SECONDS, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session = profiler.stop()
+            summary = ProfileSummary(
+                id=profile_id,
+                method=scope["method"],
+                path=scope["path"],
+                route=getattr(scope.get("route"), "path", None),
+                status=status,
+                started_at=started_at,
+                duration_ms=(time.perf_counter() - start) * 1000,
+                cpu_ms=session.cpu_time * 1000,
+                samples=session.sample_count,
+            )
+            profile_store.add(summary, session)
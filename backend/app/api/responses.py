@@ -0,0 +1,70 @@
+import hashlib
+from typing import Any, Mapping, Optional
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+
+
+class ModelResponse(Response):
+    """
+    JSON response for a handler that already built its exact response_model.
+
+    Returning a Response skips FastAPI's response handling (revalidating the content
+    against response_model, dumping it to Python objects, then json.dumps). The
+    model's precompiled pydantic-core serializer writes the JSON bytes in one pass
+    instead. The route keeps its response_model for the OpenAPI schema.
+    """
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: BaseModel,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        background: Optional[BackgroundTask] = None,
+    ) -> None:
+        super().__init__(content, status_code=status_code, headers=headers, background=background)
+
+    def render(self, content: Any) -> bytes:
+        return content.__pydantic_serializer__.to_json(content)
+
+
+def revision_etag(id: Any, version: int) -> str:
+    """
+    Strong ETag of a document, from its id and version
+    """
+    return f'"{id}-{version}"'
+
+
+def content_etag(body: bytes) -> str:
+    """
+    Strong ETag of a response body, for responses without a single revision like lists
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so a W/ prefix is ignored
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def conditional_model_response(request: Request, content: BaseModel) -> Response:
+    """
+    ModelResponse with a content ETag, or 304 when the client already has that body
+    """
+    response = ModelResponse(content)
+    etag = content_etag(response.body)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return response
@@ -1,52 +1,344 @@
-from typing import Any
+import csv
+import io
+from contextlib import aclosing
+from typing import Annotated, Any, AsyncGenerator, AsyncIterator, Literal, Optional
 from beanie import PydanticObjectId
-from fastapi import APIRouter, HTTPException
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from app.api.deps import CurrentPrincipal, CursorValuesDep, SearchCursorDep, SessionDep
+from app.api.responses import ModelResponse, conditional_model_response, etag_matches, not_modified, revision_etag
+from app.config import settings
+from app.models import (
+    CountMode,
+    Item,
+    ItemCreate,
+    ItemPublic,
+    ItemsBulkCreate,
+    ItemsBulkCreated,
+    ItemsBulkDelete,
+    ItemsBulkUpdate,
+    ItemsBulkWriteResult,
+    ItemsFilter,
+    ItemsImported,
+    ItemsImportError,
+    ItemsSelection,
+    ItemsPublic,
+    ItemsSearchResults,
+    ItemsSort,
+    ItemUpdate,
+    Message,
+)
 from app.db import crud
+from app.utils import encode_cursor
 
 router = APIRouter()
 
 
+def get_items_filter(
+    title: Optional[str] = None,
+    title_prefix: Optional[str] = None,
+    has_description: Optional[bool] = None,
+    id_gte: Optional[PydanticObjectId] = None,
+    id_lt: Optional[PydanticObjectId] = None,
+) -> ItemsFilter:
+    return ItemsFilter(
+        title=title, title_prefix=title_prefix, has_description=has_description, id_gte=id_gte, id_lt=id_lt
+    )
+
+
+async def _items_after(cursor: Optional[list[str]], sort: ItemsSort) -> Optional[list[Any]]:
+    """
+    Sort key values from a cursor, which must come from a page in an order with the same keys
+    """
+    if cursor is None:
+        return None
+    if len(cursor) != len(crud.items_sort_keys(sort)) or not PydanticObjectId.is_valid(cursor[-1]):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return [*cursor[:-1], PydanticObjectId(cursor[-1])]
+
+
 @router.get("/", response_model=ItemsPublic)
-async def read_items(session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100) -> Any:
+async def read_items(
+    request: Request,
+    session: SessionDep,
+    current_user: CurrentPrincipal,
+    cursor: CursorValuesDep,
+    items_filter: Annotated[ItemsFilter, Depends(get_items_filter)],
+    skip: int = 0,
+    limit: int = 100,
+    count_mode: CountMode = "exact",
+    sort: ItemsSort = "id",
+) -> Any:
     """
     Retrieve items.
+
+    sort is one of id, -id, title and -title (a leading - for descending order); each
+    is served in order by its own index, other orders are rejected. Filters:
+    title (exact), title_prefix, has_description, and the id range id_gte / id_lt;
+    title_prefix is only served with a title sort.
+
+    Pass the next_cursor of the previous page as cursor, with the same sort, to page by
+    the sort key instead of skip; every such page costs the same however deep it is.
+    count_mode=estimated or capped trades an exact count for a cheaper one, reported
+    with count_exact=false.
+    """
+    if items_filter.title_prefix is not None and sort in ("id", "-id"):
+        # no index returns prefix matches in _id order, they would be sorted in memory
+        raise HTTPException(status_code=400, detail="title_prefix can't be combined with an id sort")
+    owner_id = None if current_user.is_superuser else current_user.id
+    items, count, count_exact = await crud.read_items(
+        session=session,
+        owner_id=owner_id,
+        skip=skip,
+        limit=limit,
+        after=await _items_after(cursor, sort),
+        count_mode=count_mode,
+        items_filter=items_filter,
+        sort=sort,
+    )
+    next_cursor = None
+    if limit > 0 and len(items) == limit:
+        last = items[-1]
+        sort_field = crud.ITEMS_SORTS[sort][0]
+        values = [last.id] if sort_field == "_id" else [getattr(last, sort_field), last.id]
+        next_cursor = await encode_cursor(*values)
+    return conditional_model_response(
+        request, ItemsPublic(data=items, count=count, count_exact=count_exact, next_cursor=next_cursor)
+    )
+
+
+@router.get("/search", response_model=ItemsSearchResults)
+async def search_items(
+    request: Request,
+    current_user: CurrentPrincipal,
+    cursor: SearchCursorDep,
+    q: str = Query(min_length=1, max_length=256),
+    limit: int = Query(default=100, ge=1, le=1000),
+) -> Any:
+    """
+    Search items by the words of their title and description, most relevant first.
+
+    q uses MongoDB text search syntax: words, "exact phrases" and -excluded words.
+    Pass the next_cursor of the previous page as cursor for the next one.
     """
-    if current_user.is_superuser:
-        count = await Item.find().count()
-        items = await Item.find(skip=skip, limit=limit).to_list()
+    owner_id = None if current_user.is_superuser else current_user.id
+    items = await crud.search_items(session=None, q=q, owner_id=owner_id, limit=limit, after=cursor)
+    next_cursor = await encode_cursor(items[-1].score, items[-1].id) if len(items) == limit else None
+    return conditional_model_response(request, ItemsSearchResults(data=items, next_cursor=next_cursor))
+
+
+async def _items_ndjson(batches: AsyncGenerator[list[ItemPublic], None]) -> AsyncGenerator[bytes, None]:
+    async with aclosing(batches):
+        async for batch in batches:
+            yield b"".join(item.model_dump_json().encode() + b"\n" for item in batch)
+
+
+async def _items_csv(batches: AsyncGenerator[list[ItemPublic], None]) -> AsyncGenerator[bytes, None]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "title", "description", "owner_id"])
+    async with aclosing(batches):
+        async for batch in batches:
+            writer.writerows([item.id, item.title, item.description, item.owner_id] for item in batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}, "text/csv": {}}}},
+)
+async def export_items(current_user: CurrentPrincipal, format: Literal["ndjson", "csv"] = "ndjson") -> StreamingResponse:
+    """
+    Export all items as NDJSON, one item per line, or CSV.
+
+    The response is streamed from a database cursor, so memory use doesn't grow
+    with the number of items.
+    """
+    owner_id = None if current_user.is_superuser else current_user.id
+    batches = crud.iter_items_public(owner_id=owner_id, batch_size=settings.ITEMS_EXPORT_BATCH_SIZE)
+    if format == "csv":
+        content, media_type = _items_csv(batches), "text/csv"
     else:
-        count = await Item.find(Item.owner_id == current_user.id).count()
-        items = await Item.find(Item.owner_id == current_user.id, skip=skip, limit=limit).to_list()
-    items_public = [ItemPublic.model_validate(item.model_dump()) for item in items]
-    return ItemsPublic(data=items_public, count=count)
+        content, media_type = _items_ndjson(batches), "application/x-ndjson"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="items.{format}"'},
+    )
+
+
+async def _ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncGenerator[tuple[int, Optional[bytes]], None]:
+    """
+    Split a byte stream into numbered lines. A line longer than max_line_bytes is
+    dropped as it arrives and yielded as None.
+    """
+    buffer = bytearray()
+    line_number = 0
+    too_long = False
+    async for chunk in chunks:
+        start = 0
+        while (end := chunk.find(b"\n", start)) != -1:
+            line_number += 1
+            if too_long or len(buffer) + end - start > max_line_bytes:
+                yield line_number, None
+            else:
+                buffer += chunk[start:end]
+                yield line_number, bytes(buffer)
+            buffer.clear()
+            too_long = False
+            start = end + 1
+        if not too_long:
+            buffer += chunk[start:]
+            if len(buffer) > max_line_bytes:
+                buffer.clear()
+                too_long = True
+    if too_long or buffer.strip():
+        yield line_number + 1, None if too_long else bytes(buffer)
+
+
+@router.post(
+    "/import",
+    response_model=ItemsImported,
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/x-ndjson": {"schema": {"type": "string", "format": "binary"}}},
+            "required": True,
+        }
+    },
+)
+async def import_items(session: SessionDep, current_user: CurrentPrincipal, request: Request) -> Any:
+    """
+    Import items from an NDJSON body, one ItemCreate object per line.
+
+    The body is read incrementally and written in batches of ITEMS_IMPORT_BATCH_SIZE;
+    the next part of the body is only read once the previous batch is stored, so
+    memory stays flat for any body size. Lines that fail are reported by number.
+    """
+    result = ItemsImported(inserted=0, failed=0, errors=[])
+    batch: list[ItemCreate] = []
+    batch_lines: list[int] = []
+
+    def fail(line: int, error: str) -> None:
+        result.failed += 1
+        if len(result.errors) < settings.ITEMS_IMPORT_MAX_ERRORS:
+            result.errors.append(ItemsImportError(line=line, error=error))
+
+    async def flush() -> None:
+        statuses = await crud.create_items(session=session, user=current_user, items_in=batch)
+        for line, status in zip(batch_lines, statuses):
+            if status.error is None:
+                result.inserted += 1
+            else:
+                fail(line, status.error)
+        batch.clear()
+        batch_lines.clear()
+
+    async for line_number, line in _ndjson_lines(request.stream(), settings.ITEMS_IMPORT_MAX_LINE_BYTES):
+        if line is None:
+            fail(line_number, f"Line is longer than {settings.ITEMS_IMPORT_MAX_LINE_BYTES} bytes")
+            continue
+        if not line.strip():
+            continue
+        try:
+            batch.append(ItemCreate.model_validate_json(line))
+        except ValidationError as e:
+            fail(line_number, "; ".join(error["msg"] for error in e.errors()))
+            continue
+        batch_lines.append(line_number)
+        if len(batch) >= settings.ITEMS_IMPORT_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    return result
 
 
 @router.get("/{id}", response_model=ItemPublic)
-async def read_item(session: SessionDep, current_user: CurrentUser, id: PydanticObjectId) -> Any:
+async def read_item(request: Request, session: SessionDep, current_user: CurrentPrincipal, id: PydanticObjectId) -> Any:
     """
     Get item by ID.
+
+    The response carries an ETag from the item version. With a matching If-None-Match
+    only the owner and version are read and 304 is returned.
     """
-    item = await Item.get(id)
-    if not item:
+    if request.headers.get("if-none-match"):
+        revision = await crud.read_item_revision(session=session, id=id)
+        if not revision:
+            raise HTTPException(status_code=404, detail="Item not found")
+        if not current_user.is_superuser and (revision.owner_id != current_user.id):
+            raise HTTPException(status_code=400, detail="Not enough permissions")
+        etag = revision_etag(revision.id, revision.version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    found = await crud.read_public_with_version(session=session, model=Item, public_model=ItemPublic, id=id)
+    if not found:
         raise HTTPException(status_code=404, detail="Item not found")
+    item, version = found
     if not current_user.is_superuser and (item.owner_id != current_user.id):
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    return item
+    return ModelResponse(item, headers={"ETag": revision_etag(item.id, version)})
 
 
 @router.post("/", response_model=ItemPublic)
-async def create_item(session: SessionDep, current_user: CurrentUser, item_in: ItemCreate) -> Any:
+async def create_item(session: SessionDep, current_user: CurrentPrincipal, item_in: ItemCreate) -> Any:
     """
     Create new item.
     """
     item = await crud.create_item(session=session, user=current_user, item_in=item_in)
-    return item
+    return ModelResponse(ItemPublic.model_validate(item, from_attributes=True))
+
+
+@router.post("/bulk", response_model=ItemsBulkCreated)
+async def create_items(session: SessionDep, current_user: CurrentPrincipal, items_in: ItemsBulkCreate) -> Any:
+    """
+    Create many items in one write, reporting success or failure per item.
+    """
+    statuses = await crud.create_items(
+        session=session, user=current_user, items_in=items_in.data, ordered=items_in.ordered
+    )
+    failed = sum(1 for status in statuses if status.error is not None)
+    return ItemsBulkCreated(data=statuses, inserted=len(statuses) - failed, failed=failed)
+
+
+async def _bulk_selection_query(current_user: CurrentPrincipal, selection: ItemsSelection) -> dict[str, Any]:
+    if selection.ids is None and selection.filter is None:
+        raise HTTPException(status_code=400, detail="Select items by ids or filter")
+    if selection.ids is None and selection.filter is not None and not crud.items_filter_query(selection.filter):
+        # an empty filter would select every item the caller can reach
+        raise HTTPException(status_code=422, detail="The filter must restrict the selection")
+    owner_id = None if current_user.is_superuser else current_user.id
+    return crud.items_selection_query(selection, owner_id=owner_id)
+
+
+@router.patch("/bulk", response_model=ItemsBulkWriteResult)
+async def update_items(session: SessionDep, current_user: CurrentPrincipal, items_in: ItemsBulkUpdate) -> Any:
+    """
+    Update every selected item in one write.
+    """
+    query = await _bulk_selection_query(current_user, items_in)
+    if not items_in.update.model_fields_set:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    matched, modified = await crud.update_items(session=session, query=query, item_in=items_in.update)
+    return ItemsBulkWriteResult(matched=matched, modified=modified)
+
+
+@router.delete("/bulk", response_model=ItemsBulkWriteResult)
+async def delete_items(session: SessionDep, current_user: CurrentPrincipal, items_in: ItemsBulkDelete) -> Any:
+    """
+    Delete every selected item in one write.
+    """
+    query = await _bulk_selection_query(current_user, items_in)
+    deleted = await crud.delete_items(session=session, query=query)
+    return ItemsBulkWriteResult(matched=deleted, modified=deleted)
 
 
 @router.put("/{id}", response_model=ItemPublic)
-async def update_item(session: SessionDep, current_user: CurrentUser, id: PydanticObjectId, item_in: ItemUpdate) -> Any:
+async def update_item(session: SessionDep, current_user: CurrentPrincipal, id: PydanticObjectId, item_in: ItemUpdate) -> Any:
     """
     Update an item.
     """
@@ -55,12 +347,12 @@ async def update_item(session: SessionDep, current_user: CurrentUser, id: Pydant
         raise HTTPException(status_code=404, detail="Item not found")
     if not current_user.is_superuser and (item.owner_id != current_user.id):
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    await item.set(item_in.model_dump(exclude_unset=True))
-    return item
+    item = await crud.update_item(session=session, item=item, item_in=item_in)
+    return ModelResponse(ItemPublic.model_validate(item, from_attributes=True))
 
 
 @router.delete("/{id}")
-async def delete_item(session: SessionDep, current_user: CurrentUser, id: PydanticObjectId) -> Message:
+async def delete_item(session: SessionDep, current_user: CurrentPrincipal, id: PydanticObjectId) -> Message:
     """
     Delete an item.
     """
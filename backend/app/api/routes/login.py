@@ -1,14 +1,15 @@
+import math
 from datetime import timedelta
 from typing import Annotated, Any
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from app.db import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import CurrentPrincipal, SessionDep, get_current_active_superuser
 from app.core import security
+from app.core.ratelimit import login_ip_limiter, login_user_limiter
 from app.config import settings
-from app.core.security import get_password_hash
-from app.models import Message, NewPassword, Token, UserPublic
+from app.models import Message, NewPassword, Token, UserPublic, UserUpdate
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
@@ -21,21 +22,39 @@ router = APIRouter()
 
 
 @router.post("/login/access-token")
-async def login_access_token(session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token:
+async def login_access_token(
+    request: Request, session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
+
+    Attempts are throttled per client IP and per username before the password is
+    checked; a successful login gives its attempt back.
     """
+    client_ip = request.client.host if request.client else ""
+    username = form_data.username.lower()
+    if settings.LOGIN_RATE_LIMIT_ENABLED:
+        retry_after = login_ip_limiter.hit(client_ip) or login_user_limiter.hit(username)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
     user = await crud.authenticate(session=session, email=form_data.username, password=form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    elif not user.is_active:
+    if settings.LOGIN_RATE_LIMIT_ENABLED:
+        login_ip_limiter.refund(client_ip)
+        login_user_limiter.refund(username)
+    if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return Token(access_token=await security.create_access_token(user.id, expires_delta=access_token_expires))
 
 
 @router.post("/login/test-token", response_model=UserPublic)
-async def test_token(current_user: CurrentUser) -> Any:
+async def test_token(current_user: CurrentPrincipal) -> Any:
     """
     Test access token
     """
@@ -79,8 +98,7 @@ async def reset_password(session: SessionDep, body: NewPassword) -> Message:
         )
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    user.hashed_password = await get_password_hash(password=body.new_password)
-    await user.save()
+    await crud.update_user(session=session, user=user, user_in=UserUpdate(password=body.new_password))
     return Message(message="Password updated successfully")
 
 
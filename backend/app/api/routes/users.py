@@ -1,12 +1,14 @@
 from typing import Any
 from beanie import PydanticObjectId
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from app.db import crud
 from app.config import settings
-from app.utils import generate_new_account_email, send_email
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
-from app.core.security import get_password_hash, verify_password
+from app.utils import encode_cursor, generate_new_account_email, send_email
+from app.api.deps import CurrentPrincipal, CurrentUser, CursorDep, SessionDep, get_current_active_superuser
+from app.api.responses import ModelResponse, conditional_model_response, etag_matches, not_modified, revision_etag
+from app.core.security import verify_password
 from app.models import (
+    CountMode,
     Message,
     UpdatePassword,
     User,
@@ -23,14 +25,27 @@ router = APIRouter()
 
 
 @router.get("/", dependencies=[Depends(get_current_active_superuser)], response_model=UsersPublic)
-async def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_users(
+    request: Request,
+    session: SessionDep,
+    cursor: CursorDep,
+    skip: int = 0,
+    limit: int = 100,
+    count_mode: CountMode = "exact",
+) -> Any:
     """
     Retrieve users.
+
+    Pass the next_cursor of the previous page as cursor to page by _id instead of skip.
+    count_mode=estimated or capped trades an exact count for a cheaper one.
     """
-    count = await User.count()
-    users = await User.find(session=session, skip=skip, limit=limit).to_list()
-    users_public = [UserPublic.model_validate(user.model_dump()) for user in users]
-    return UsersPublic(data=users_public, count=count)
+    users, count, count_exact = await crud.read_users(
+        session=session, skip=skip, limit=limit, after=cursor, count_mode=count_mode
+    )
+    next_cursor = await encode_cursor(users[-1].id) if limit > 0 and len(users) == limit else None
+    return conditional_model_response(
+        request, UsersPublic(data=users, count=count, count_exact=count_exact, next_cursor=next_cursor)
+    )
 
 
 @router.post("/", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic)
@@ -68,9 +83,9 @@ async def update_user_me(session: SessionDep, user_in: UserUpdateMe, current_use
             raise HTTPException(
                 status_code=409, detail="User with this email already exists"
             )
-    user_data = user_in.model_dump(exclude_unset=True)
-    await current_user.set(expression=user_data, session=session)
-    return current_user
+    user_update = UserUpdate.model_validate(user_in.model_dump(exclude_unset=True))
+    user = await crud.update_user(session=session, user=current_user, user_in=user_update)
+    return user
 
 
 @router.patch("/me/password", response_model=Message)
@@ -82,18 +97,16 @@ async def update_password_me(session: SessionDep, body: UpdatePassword, current_
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
         raise HTTPException(status_code=400, detail="New password cannot be the same as the current one")
-    hashed_password = await get_password_hash(body.new_password)
-    current_user.hashed_password = hashed_password
-    await current_user.save(session=session)
+    await crud.update_user(session=session, user=current_user, user_in=UserUpdate(password=body.new_password))
     return Message(message="Password updated successfully")
 
 
 @router.get("/me", response_model=UserPublic)
-async def read_user_me(current_user: CurrentUser) -> Any:
+async def read_user_me(request: Request, current_user: CurrentPrincipal) -> Any:
     """
     Get current user.
     """
-    return current_user
+    return conditional_model_response(request, current_user)
 
 
 @router.delete("/me", response_model=Message)
@@ -122,22 +135,39 @@ async def register_user(session: SessionDep, user_in: UserRegister) -> Any:
 
 
 @router.get("/{user_id}", response_model=UserPublic)
-async def read_user_by_id(session: SessionDep, user_id: PydanticObjectId, current_user: CurrentUser) -> Any:
+async def read_user_by_id(
+    request: Request, session: SessionDep, user_id: PydanticObjectId, current_user: CurrentPrincipal
+) -> Any:
     """
     Get a specific user by id.
-    """
-    user = await crud.read_user_by_id(session=session, id=user_id)
-    if not user:
-        raise HTTPException(
-            status_code=404,
-            detail="The user with this id does not exist in the system",
-        )
+
+    The response carries an ETag from the user version. With a matching If-None-Match
+    only the version is read and 304 is returned.
+    """
+    not_found = HTTPException(
+        status_code=404,
+        detail="The user with this id does not exist in the system",
+    )
+    forbidden = HTTPException(
+        status_code=403,
+        detail="The user doesn't have enough privileges",
+    )
+    if request.headers.get("if-none-match"):
+        revision = await crud.read_user_revision(session=session, id=user_id)
+        if not revision:
+            raise not_found
+        if not current_user.is_superuser and revision.id != current_user.id:
+            raise forbidden
+        etag = revision_etag(revision.id, revision.version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    found = await crud.read_public_with_version(session=session, model=User, public_model=UserPublic, id=user_id)
+    if not found:
+        raise not_found
+    user, version = found
     if not current_user.is_superuser and user.id != current_user.id:
-        raise HTTPException(
-            status_code=403,
-            detail="The user doesn't have enough privileges",
-        )
-    return user
+        raise forbidden
+    return ModelResponse(user, headers={"ETag": revision_etag(user.id, version)})
 
 
 @router.patch("/{user_id}", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic)
@@ -162,7 +192,7 @@ async def update_user(session: SessionDep, user_id: PydanticObjectId, user_in: U
 
 
 @router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser)])
-async def delete_user(session: SessionDep, user_id: PydanticObjectId, current_user: CurrentUser) -> Message:
+async def delete_user(session: SessionDep, user_id: PydanticObjectId, current_user: CurrentPrincipal) -> Message:
     """
     Delete a user.
     """
@@ -1,7 +1,22 @@
-from fastapi import APIRouter, Depends
+from typing import Any
+from beanie import PydanticObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic.networks import EmailStr
+from app.announcements import start_announcement
 from app.api.deps import get_current_active_superuser
-from app.models import Message
+from app.api.profiling import profile_store, render_collapsed, render_speedscope
+from app.api.responses import ModelResponse
+from app.config import settings
+from app.db.monitoring import slow_query_log
+from app.models import (
+    Announcement,
+    AnnouncementCreate,
+    AnnouncementPublic,
+    Message,
+    ProfileFormat,
+    Profiles,
+    SlowQueries,
+)
 from app.utils import generate_test_email, send_email
 
 router = APIRouter()
@@ -18,4 +33,92 @@ async def test_email(email_to: EmailStr) -> Message:
         subject=email_data.subject,
         html_content=email_data.html_content,
         )
-    return Message(message="Test email sent")
\ No newline at end of file
+    return Message(message="Test email sent")
+
+
+@router.post(
+    "/announcements/",
+    dependencies=[Depends(get_current_active_superuser)],
+    status_code=202,
+    response_model=AnnouncementPublic,
+)
+async def create_announcement(announcement_in: AnnouncementCreate) -> Any:
+    """
+    Email an announcement to the users matching a filter.
+
+    Delivery runs in the background at most ANNOUNCEMENT_RATE_PER_SECOND messages per
+    second; follow its progress with GET /utils/announcements/{id}.
+    """
+    if not settings.emails_enabled:
+        raise HTTPException(status_code=400, detail="Emails are not enabled")
+    announcement = Announcement.model_validate(announcement_in.model_dump())
+    await start_announcement(announcement)
+    return ModelResponse(AnnouncementPublic.model_validate(announcement, from_attributes=True), status_code=202)
+
+
+@router.get(
+    "/announcements/{id}",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=AnnouncementPublic,
+)
+async def read_announcement(id: PydanticObjectId) -> Any:
+    """
+    Get an announcement and the progress of its delivery.
+    """
+    announcement = await Announcement.find_one(Announcement.id == id).project(AnnouncementPublic)
+    if not announcement:
+        raise HTTPException(status_code=404, detail="Announcement not found")
+    return ModelResponse(announcement)
+
+
+@router.get(
+    "/slow-queries/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=SlowQueries,
+)
+async def read_slow_queries(limit: int = Query(default=20, ge=1, le=1000)) -> Any:
+    """
+    Database command shapes slower than SLOW_QUERY_THRESHOLD_MS since startup, in this
+    process, slowest p99 first, with the routes that sent them.
+    """
+    return ModelResponse(SlowQueries(data=slow_query_log.top(limit), count=len(slow_query_log)))
+
+
+@router.delete("/slow-queries/", dependencies=[Depends(get_current_active_superuser)])
+async def clear_slow_queries() -> Message:
+    """
+    Start the slow query table over, e.g. after adding an index.
+    """
+    slow_query_log.clear()
+    return Message(message="Slow queries cleared")
+
+
+@router.get(
+    "/profiles/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=Profiles,
+)
+async def read_profiles() -> Any:
+    """
+    Requests profiled with the X-Profile header, in this process, most recent first.
+    """
+    return ModelResponse(Profiles(data=profile_store.list(), count=len(profile_store)))
+
+
+@router.get("/profiles/{id}", dependencies=[Depends(get_current_active_superuser)])
+async def read_profile(id: str, format: ProfileFormat = "speedscope") -> Response:
+    """
+    A request profile, as a speedscope file (open it on https://www.speedscope.app) or
+    as collapsed stacks for flame graph tools.
+    """
+    profile = profile_store.get(id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    _, session = profile
+    if format == "collapsed":
+        return Response(render_collapsed(session), media_type="text/plain")
+    return Response(
+        render_speedscope(session),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="profile-{id}.speedscope.json"'},
+    )
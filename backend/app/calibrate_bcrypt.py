@@ -0,0 +1,45 @@
+import argparse
+import statistics
+import time
+from passlib.hash import bcrypt
+
+
+def measure(rounds: int, samples: int = 3) -> float:
+    """
+    Median seconds to hash a password with this bcrypt cost on this machine
+    """
+    hasher = bcrypt.using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.hash("calibration password")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def calibrate(budget_ms: float, min_rounds: int = 4, max_rounds: int = 31) -> tuple[int, dict[int, float]]:
+    """
+    Highest cost that hashes within budget_ms, and the timings measured on the way
+    """
+    timings: dict[int, float] = {}
+    recommended = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        timings[rounds] = measure(rounds) * 1000
+        if timings[rounds] > budget_ms:
+            break
+        recommended = rounds
+    return recommended, timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recommend BCRYPT_ROUNDS for a per-hash latency budget")
+    parser.add_argument("--budget-ms", type=float, default=100, help="target time for one hash (default: 100)")
+    args = parser.parse_args()
+    recommended, timings = calibrate(args.budget_ms)
+    for rounds, elapsed_ms in timings.items():
+        print(f"rounds={rounds:2d}  {elapsed_ms:9.1f} ms")
+    print(f"BCRYPT_ROUNDS={recommended}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import secrets
 import warnings
 import logging
-from pydantic import computed_field, HttpUrl, AnyUrl, BeforeValidator, model_validator
+from pydantic import computed_field, Field, HttpUrl, AnyUrl, BeforeValidator, model_validator
 from pydantic_core import MultiHostUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Annotated, Any, Literal
@@ -57,6 +57,20 @@ class Settings(BaseSettings):
             username=self.DB_USER,
             password=self.DB_PASSWORD,
         ))
+
+    DB_MAX_POOL_SIZE: int = 100
+    DB_MIN_POOL_SIZE: int = 0
+    DB_MAX_IDLE_TIME_MS: int | None = 5 * 60 * 1000 # close pooled connections idle for 5 minutes
+    DB_WAIT_QUEUE_TIMEOUT_MS: int | None = None
+    SLOW_QUERY_THRESHOLD_MS: float | None = 100 # slower commands are logged and aggregated by shape; None disables
+    SLOW_QUERY_MAX_SHAPES: int = 1000 # least recently seen shapes are dropped beyond this
+    SLOW_QUERY_SAMPLES: int = 1000 # latest durations kept per shape for its percentiles
+    COUNT_CAP: int = 10_000 # listings with count_mode=capped report at most this many
+    ITEMS_BULK_MAX_SIZE: int = 1000 # items or ids per bulk request, read once when app.models is imported
+    ITEMS_EXPORT_BATCH_SIZE: int = 1000 # documents per cursor batch and per streamed chunk
+    ITEMS_IMPORT_BATCH_SIZE: int = 1000 # lines per insert_many
+    ITEMS_IMPORT_MAX_LINE_BYTES: int = 1024 * 1024
+    ITEMS_IMPORT_MAX_ERRORS: int = 1000 # errors listed in the response, the rest are only counted
     
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
@@ -66,6 +80,17 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str | None = None
     EMAILS_FROM_EMAIL: str | None = None
     EMAILS_FROM_NAME: str | None = None
+    SMTP_TIMEOUT_SECONDS: float = 30
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 8 # failed deliveries before a message is dead-lettered
+    EMAIL_OUTBOX_RETRY_BASE_SECONDS: float = 30 # doubled after every failed attempt
+    EMAIL_OUTBOX_RETRY_MAX_SECONDS: float = 60 * 60
+    EMAIL_OUTBOX_LEASE_SECONDS: float = 5 * 60 # a message left sending this long is retried
+    EMAIL_OUTBOX_POLL_SECONDS: float = 10 # idle worker checks for due retries this often
+    EMAIL_OUTBOX_RETENTION_SECONDS: float = 7 * 24 * 60 * 60 # sent and dead messages are deleted after this long
+    ANNOUNCEMENT_SMTP_CONNECTIONS: int = 4 # concurrent SMTP connections of one announcement
+    ANNOUNCEMENT_RATE_PER_SECOND: float = 10 # messages per second across those connections
+    ANNOUNCEMENT_BATCH_SIZE: int = 500 # recipients per cursor batch, progress is saved after each
+    ANNOUNCEMENT_LEASE_SECONDS: float = 60 # a running announcement not renewed for this long is failed
 
     @model_validator(mode="after")
     def _set_default_emails_from(self) -> Self:
@@ -80,6 +105,29 @@ class Settings(BaseSettings):
     def emails_enabled(self) -> bool:
         return bool(self.SMTP_HOST and self.EMAILS_FROM_EMAIL)
 
+    BCRYPT_ROUNDS: int = Field(default=12, ge=4, le=31) # stored hashes of another cost are redone on login
+    PASSWORD_HASH_EXECUTOR: Literal["thread", "process"] = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 64 # calls waiting for a worker before new ones get 503
+
+    LOGIN_RATE_LIMIT_ENABLED: bool = True
+    # proxies whose X-Forwarded-For is trusted for the client IP, comma-separated, or * for any
+    FORWARDED_ALLOW_IPS: str = "127.0.0.1"
+    LOGIN_IP_RATE_PER_MINUTE: float = 30 # login attempts per client IP, after the burst
+    LOGIN_IP_BURST: int = 10
+    LOGIN_USER_RATE_PER_MINUTE: float = 10 # login attempts per username, after the burst
+    LOGIN_USER_BURST: int = 5
+    LOGIN_RATE_LIMIT_MAX_KEYS: int = 100_000 # IPs and usernames tracked, each
+
+    METRICS_ENABLED: bool = True # time every request and serve /metrics
+    PROFILING_ENABLED: bool = True # superusers may send X-Profile: 1 to profile a request
+    PROFILE_INTERVAL_SECONDS: float = 0.001 # sampling interval of the profiler
+    PROFILE_MAX_PROFILES: int = 50 # the oldest profile is dropped beyond this
+
+    PRINCIPAL_CACHE_ENABLED: bool = True
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10_000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30
+
     EMAIL_TEST_USER: str = "test@example.com"
     FIRST_SUPERUSER: str
     FIRST_SUPERUSER_PASSWORD: str
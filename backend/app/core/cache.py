@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, TypeVar
+from app.config import settings
+from app.core.metrics import registry
+from app.models import UserPublic
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    In-process LRU cache whose entries also expire after ttl seconds.
+
+    Every invalidation bumps version; a value loaded before an invalidation is
+    dropped by set(), so a slow read can't put a stale entry back.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: K, value: V, version: Optional[int] = None) -> None:
+        if self.max_size <= 0 or (version is not None and version != self.version):
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        self.version += 1
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self.version += 1
+        self._data.clear()
+
+
+# user id (the JWT subject) -> UserPublic snapshot used by get_current_principal
+principal_cache: TTLCache[str, UserPublic] = TTLCache(
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+registry.callback(
+    "principal_cache_lookups", "Principal cache lookups by result", "counter",
+    lambda: [(("hit",), principal_cache.hits), (("miss",), principal_cache.misses)],
+    labelnames=("result",),
+)
@@ -0,0 +1,228 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Generic, Iterable, Optional, TypeVar
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Latency buckets in seconds, from a fast cached read to a slow bulk request
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# any other request method is labelled "other", so clients can't create series at will
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+M = TypeVar("M", "Counter", "Histogram")
+
+# Recording is a plain attribute or list slot increment, without locks: updates made
+# from the event loop are exact, while the pymongo listeners run on Motor's worker
+# threads, where an increment racing another one may rarely be lost. That is accepted
+# for counters that are only ever read as rates.
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Histogram:
+    """
+    Observation counts per bucket upper bound, plus their sum; cumulated on exposition
+    """
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # one slot per bucket and a last one for +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Family(Generic[M]):
+    """
+    A metric name with one child Counter or Histogram per combination of label values.
+
+    Children are created on first use and kept; callers on a hot path resolve the
+    children they need once and hold on to them.
+    """
+    def __init__(self, name: str, help: str, type: str, labelnames: tuple[str, ...], factory: Callable[[], M]) -> None:
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = labelnames
+        self._factory: Callable[[], M] = factory
+        self._children: dict[tuple[str, ...], M] = {}
+
+    def labels(self, *values: str) -> M:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._factory())
+        return child
+
+    def samples(self) -> Iterable[tuple[str, dict[str, str], float]]:
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            if isinstance(child, Counter):
+                yield self.name + "_total", labels, child.value
+                continue
+            cumulative = 0
+            for bound, count in zip(child.buckets, child.counts):
+                cumulative += count
+                yield self.name + "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            cumulative += child.counts[-1]
+            yield self.name + "_bucket", {**labels, "le": "+Inf"}, cumulative
+            yield self.name + "_sum", labels, child.sum
+            yield self.name + "_count", labels, cumulative
+
+
+class Callback:
+    """
+    A metric read at exposition time from state kept elsewhere, e.g. a queue length
+    """
+    def __init__(
+        self, name: str, help: str, type: str, labelnames: tuple[str, ...],
+        collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = labelnames
+        self._collect = collect
+
+    def samples(self) -> Iterable[tuple[str, dict[str, str], float]]:
+        name = self.name + "_total" if self.type == "counter" else self.name
+        for values, value in self._collect():
+            yield name, dict(zip(self.labelnames, values)), value
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Family[Any] | Callback] = {}
+
+    def _register(self, metric: Family[Any] | Callback) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Family[Counter]:
+        return self._register(Family(name, help, "counter", labelnames, Counter))
+
+    def histogram(
+        self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Family[Histogram]:
+        return self._register(Family(name, help, "histogram", labelnames, lambda: Histogram(buckets)))
+
+    def callback(
+        self, name: str, help: str, type: str, collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+        labelnames: tuple[str, ...] = (),
+    ) -> Callback:
+        return self._register(Callback(name, help, type, labelnames, collect))
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+registry = Registry()
+
+# ASGI scope of the request being handled; the router adds the matched "route" to it
+request_scope: ContextVar[Optional[Scope]] = ContextVar("request_scope", default=None)
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+http_requests = registry.counter("http_requests", "HTTP responses by route and status", ("method", "route", "status"))
+
+
+class _RouteMetrics:
+    __slots__ = ("duration", "method", "route", "statuses")
+
+    def __init__(self, method: str, route: str) -> None:
+        self.method = method
+        self.route = route
+        self.duration = http_request_duration.labels(method, route)
+        self.statuses: dict[int, Counter] = {}
+
+    def status(self, status: int) -> Counter:
+        counter = self.statuses.get(status)
+        if counter is None:
+            counter = self.statuses[status] = http_requests.labels(self.method, self.route, str(status))
+        return counter
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording the latency and status of every HTTP request.
+
+    Requests are labelled with the path template of the route that handled them, e.g.
+    /api/v1/items/{id}, so the number of series stays bounded; requests matching no
+    route share one "unmatched" label. The scope is also published in request_scope,
+    for the database monitoring to tell which route issued a command.
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        # route path template -> method -> its metrics, resolved on first use
+        self._routes: dict[str, dict[str, _RouteMetrics]] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        token = request_scope.set(scope)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_scope.reset(token)
+            path = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"] if scope["method"] in HTTP_METHODS else "other"
+            methods = self._routes.get(path)
+            if methods is None:
+                methods = self._routes.setdefault(path, {})
+            metrics = methods.get(method)
+            if metrics is None:
+                metrics = methods[method] = _RouteMetrics(method, path)
+            metrics.duration.observe(time.perf_counter() - start)
+            metrics.status(status).inc()
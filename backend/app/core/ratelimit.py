@@ -0,0 +1,111 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.config import settings
+from app.core.metrics import registry
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate tokens per second, holding at most capacity tokens.
+
+    Not thread-safe; meant for use from the event loop.
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens if available and return 0, otherwise return the seconds until they are
+        """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Wait until tokens are available and take them
+        """
+        while (wait := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+
+class KeyedRateLimiter:
+    """
+    One token bucket per key, e.g. per client IP, keeping at most max_keys buckets.
+
+    The least recently used bucket is evicted first; an idle bucket has refilled anyway,
+    so evicting it only loses state that no longer restricts anything.
+    """
+    def __init__(self, rate: float, capacity: float, max_keys: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+
+    def hit(self, key: str) -> float:
+        """
+        Count an attempt for key; returns 0 when allowed, otherwise the seconds to wait
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        wait = bucket.try_acquire()
+        if wait:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def refund(self, key: str) -> None:
+        """
+        Give back the token of an attempt that should not count, e.g. a successful login
+        """
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# Login attempts per client IP and per username, checked before any password hashing
+login_ip_limiter = KeyedRateLimiter(
+    rate=settings.LOGIN_IP_RATE_PER_MINUTE / 60,
+    capacity=settings.LOGIN_IP_BURST,
+    max_keys=settings.LOGIN_RATE_LIMIT_MAX_KEYS,
+)
+login_user_limiter = KeyedRateLimiter(
+    rate=settings.LOGIN_USER_RATE_PER_MINUTE / 60,
+    capacity=settings.LOGIN_USER_BURST,
+    max_keys=settings.LOGIN_RATE_LIMIT_MAX_KEYS,
+)
+registry.callback(
+    "login_rate_limit_attempts", "Login attempts checked against each limiter, by result", "counter",
+    lambda: [
+        ((name, result), getattr(limiter, result))
+        for name, limiter in (("ip", login_ip_limiter), ("user", login_user_limiter))
+        for result in ("allowed", "rejected")
+    ],
+    labelnames=("limiter", "result"),
+)
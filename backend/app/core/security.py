@@ -1,13 +1,94 @@
+import asyncio
 import jwt
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, Callable, Optional, TypeVar
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 from app.config import settings
+from app.core.metrics import Histogram, registry
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# needs_update() is true for bcrypt hashes of any other cost than BCRYPT_ROUNDS
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 ALGORITHM = "HS256"
 
+T = TypeVar("T")
+
+# bcrypt is CPU bound, so hashing runs on a bounded pool instead of the event loop.
+# _pending counts calls running or queued on the pool, until they complete there even
+# if their caller went away; it is only touched from the event loop thread, so it
+# needs no lock.
+_executor: Optional[Executor] = None
+_pending = 0
+
+password_hash_duration = registry.histogram(
+    "password_hash_duration_seconds", "Password hashing pool latency, queueing included", ("operation",)
+)
+_verify_duration = password_hash_duration.labels("verify")
+_hash_duration = password_hash_duration.labels("hash")
+password_hash_rejected = registry.counter(
+    "password_hash_rejected", "Password hashing calls refused with 503 because the queue was full"
+).labels()
+registry.callback(
+    "password_hash_queue_depth", "Password hashing calls running or queued on the pool", "gauge",
+    lambda: [((), _pending)],
+)
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+            )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run_in_pool(duration: Histogram, func: Callable[..., T], *args: Any) -> T:
+    """
+    Run func on the password hashing pool, failing fast with 503 once the queue is full.
+    """
+    global _pending
+    if _pending >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_MAX_QUEUE:
+        password_hash_rejected.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again later",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    start = time.perf_counter()
+
+    def release(_: asyncio.Future) -> None:
+        global _pending
+        _pending -= 1
+        duration.observe(time.perf_counter() - start)
+
+    future = asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+    future.add_done_callback(release)
+    # a cancelled caller leaves the call to finish on the pool, where it still counts
+    return await asyncio.shield(future)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
 
 async def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     expire = datetime.now(timezone.utc) + expires_delta
@@ -17,8 +98,15 @@ async def create_access_token(subject: str | Any, expires_delta: timedelta) -> s
 
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return await _run_in_pool(_verify_duration, _verify, plain_password, hashed_password)
 
 
 async def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
\ No newline at end of file
+    return await _run_in_pool(_hash_duration, _hash, password)
+
+
+async def password_needs_update(hashed_password: str) -> bool:
+    """
+    Whether a stored hash uses another scheme or cost than the current settings; cheap, no hashing
+    """
+    return pwd_context.needs_update(hashed_password)
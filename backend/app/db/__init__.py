@@ -1,19 +1,56 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorClientSession
 from beanie import init_beanie
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 from app.config import settings, logger
-from app.models import User, Item, UserCreate
+from app.models import Announcement, EmailOutbox, User, Item, UserCreate
 from . import crud
+from .monitoring import command_metrics, pool_metrics, slow_queries
 
 
-async def get_session() -> AsyncGenerator[AsyncIOMotorClientSession, None]:
-    client = AsyncIOMotorClient(settings.DB_URL)
-    try:
-        await init_beanie(database=client[settings.DB_DATABASE], document_models=[Item, User])
-        async with await client.start_session() as session:
-            yield session
-    finally:
+client: Optional[AsyncIOMotorClient] = None
+# the loop client was created on; Motor clients can't be used from another one
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def connect() -> AsyncIOMotorClient:
+    """
+    Create the process-wide client and initialize Beanie, once per event loop.
+
+    Called from the application lifespan; scripts and tests that run without the
+    lifespan get the same client lazily on their first session. A caller on another
+    loop than the client's, e.g. the next test on a fresh loop, gets a new client and
+    the old one is closed.
+    """
+    global client, _client_loop
+    loop = asyncio.get_running_loop()
+    if client is None or _client_loop is not loop:
+        if client is not None:
+            client.close()
+        _client: AsyncIOMotorClient = AsyncIOMotorClient(
+            settings.DB_URL,
+            maxPoolSize=settings.DB_MAX_POOL_SIZE,
+            minPoolSize=settings.DB_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.DB_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=settings.DB_WAIT_QUEUE_TIMEOUT_MS,
+            event_listeners=[command_metrics, pool_metrics, slow_queries],
+        )
+        await init_beanie(database=_client[settings.DB_DATABASE], document_models=[Announcement, EmailOutbox, Item, User])
+        client, _client_loop = _client, loop
+    return client
+
+
+async def disconnect() -> None:
+    global client, _client_loop
+    if client is not None:
         client.close()
+        client, _client_loop = None, None
+
+
+async def get_session() -> AsyncGenerator[AsyncIOMotorClientSession, None]:
+    _client = await connect()
+    async with await _client.start_session() as session:
+        yield session
 
 
 async def init_db(session: AsyncIOMotorClientSession) -> None:
@@ -1,8 +1,67 @@
-from typing import Optional
-from beanie import PydanticObjectId
+import asyncio
+import re
+from typing import Any, AsyncGenerator, Optional, TypeVar
+from beanie import Document, PydanticObjectId
+from beanie.odm.utils.projection import get_projection
 from motor.motor_asyncio import AsyncIOMotorClientSession
-from app.core.security import get_password_hash, verify_password
-from app.models import User, UserCreate, UserUpdate, Item, ItemCreate
+from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from app.config import settings, logger
+from app.core.cache import principal_cache
+from app.core.security import get_password_hash, password_needs_update, verify_password
+from app.models import (
+    CountMode,
+    User,
+    UserCreate,
+    UserPublic,
+    UserRevision,
+    UserUpdate,
+    UsersFilter,
+    Item,
+    ItemBulkStatus,
+    ItemCreate,
+    ItemPublic,
+    ItemRevision,
+    ItemSearchResult,
+    ItemsFilter,
+    ItemsSort,
+    ItemsSelection,
+    ItemUpdate,
+)
+
+PublicModel = TypeVar("PublicModel", bound=BaseModel)
+
+
+async def count_documents(model: type[Document], filter: dict[str, Any], count_mode: CountMode = "exact") -> tuple[int, bool]:
+    """
+    Count the documents matching filter, returning the count and whether it is exact.
+
+    "estimated" reads the collection metadata and only applies to an empty filter;
+    otherwise it falls back to "capped", which stops counting after COUNT_CAP matches.
+    """
+    collection = model.get_motor_collection()
+    if count_mode == "estimated" and not filter:
+        return await collection.estimated_document_count(), False
+    if count_mode == "exact":
+        return await collection.count_documents(filter), True
+    count = await collection.count_documents(filter, limit=settings.COUNT_CAP + 1)
+    return min(count, settings.COUNT_CAP), count <= settings.COUNT_CAP
+
+
+async def read_public_with_version(
+    session: Optional[AsyncIOMotorClientSession], model: type[Document], public_model: type[PublicModel], id: PydanticObjectId
+) -> Optional[tuple[PublicModel, int]]:
+    """
+    Public projection of a document together with its version, in one query.
+    """
+    public_projection = get_projection(public_model)
+    assert public_projection is not None
+    projection = {**public_projection, "version": 1}
+    document = await model.get_motor_collection().find_one({"_id": id}, projection, session=session)
+    if document is None:
+        return None
+    return public_model.model_validate(document), document.get("version", 0)
 
 
 async def create_user(session: AsyncIOMotorClientSession, user_create: UserCreate) -> User:
@@ -19,6 +78,40 @@ async def read_user_by_id(session: AsyncIOMotorClientSession, id: PydanticObject
     return user
 
 
+async def read_user_public(session: Optional[AsyncIOMotorClientSession], id: PydanticObjectId) -> Optional[UserPublic]:
+    """
+    Public fields of a user, projected in the database and not hydrated as a document.
+    """
+    user = await User.find_one(User.id == id, session=session).project(UserPublic)
+    return user
+
+
+async def read_user_revision(session: Optional[AsyncIOMotorClientSession], id: PydanticObjectId) -> Optional[UserRevision]:
+    user = await User.find_one(User.id == id, session=session).project(UserRevision)
+    return user
+
+
+async def read_users(
+    session: AsyncIOMotorClientSession,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[PydanticObjectId] = None,
+    count_mode: CountMode = "exact",
+) -> tuple[list[UserPublic], int, bool]:
+    """
+    Page of users in _id order, the total count and whether the count is exact.
+
+    With after (keyset mode) the page starts right after that _id and skip is ignored.
+    The page and the count are fetched concurrently, in one round trip of latency.
+    """
+    query = User.find(User.id > after, session=session) if after is not None else User.find(session=session).skip(skip)
+    (count, count_exact), users = await asyncio.gather(
+        count_documents(User, {}, count_mode),
+        query.sort(+User.id).limit(limit).project(UserPublic).to_list(),
+    )
+    return users, count, count_exact
+
+
 async def read_user_by_email(session: AsyncIOMotorClientSession, email: str) -> Optional[User]:
     user = await User.find_one(User.email == email, session=session)
     return user
@@ -28,28 +121,341 @@ async def update_user(session: AsyncIOMotorClientSession, user: User, user_in: U
     user_data = user_in.model_dump(exclude_unset=True)
     if "password" in user_data:
         user_data["hashed_password"] = await get_password_hash(user_data.pop("password"))
-    await user.set(expression=user_data, session=session)
+    update: dict[str, Any] = {"$inc": {"version": 1}}
+    if user_data:
+        update["$set"] = user_data
+    await user.update(update, session=session)
+    principal_cache.invalidate(str(user.id))
     return user
 
 
 async def delete_user(session: AsyncIOMotorClientSession, user: User) -> None:
     await user.delete(session=session)
+    principal_cache.invalidate(str(user.id))
     return
 
 
+# Background password rehashes, referenced until done so they aren't garbage collected
+_rehash_tasks: set[asyncio.Task] = set()
+
+
+async def rehash_password(user_id: PydanticObjectId, hashed_password: str, password: str) -> None:
+    """
+    Store password hashed with the current settings, unless the stored hash changed meanwhile.
+    """
+    try:
+        new_hashed_password = await get_password_hash(password)
+        await User.find_one(User.id == user_id, User.hashed_password == hashed_password).update(
+            {"$set": {"hashed_password": new_hashed_password}}
+        )
+    except Exception as e:
+        logger.warning(f"Rehashing the password of user {user_id} failed: {e!r}")
+
+
 async def authenticate(session: AsyncIOMotorClientSession, email: str, password: str) -> Optional[User]:
+    """
+    The user with these credentials, if any.
+
+    A stored hash of an outdated scheme or cost is replaced in the background, so the
+    login itself only pays for one verification.
+    """
     user = await read_user_by_email(session=session, email=email)
     if not user:
         return None
     if not await verify_password(password, user.hashed_password):
         return None
+    if await password_needs_update(user.hashed_password):
+        task = asyncio.create_task(rehash_password(user.id, user.hashed_password, password))
+        _rehash_tasks.add(task)
+        task.add_done_callback(_rehash_tasks.discard)
     return user
 
 
-async def create_item(session: AsyncIOMotorClientSession, user: User, item_in: ItemCreate) -> Item:
+def users_filter_query(users_filter: UsersFilter) -> dict[str, Any]:
+    query: dict[str, Any] = {}
+    if users_filter.is_active is not None:
+        query["is_active"] = users_filter.is_active
+    if users_filter.is_superuser is not None:
+        query["is_superuser"] = users_filter.is_superuser
+    if users_filter.email_domain is not None:
+        query["email"] = {"$regex": f"@{re.escape(users_filter.email_domain.lstrip('@'))}$", "$options": "i"}
+    return query
+
+
+async def iter_users_public(
+    users_filter: UsersFilter, batch_size: int = 1000
+) -> AsyncGenerator[list[UserPublic], None]:
+    """
+    Stream the users matching users_filter in _id order, one cursor batch at a time.
+    """
+    cursor = User.get_motor_collection().find(
+        users_filter_query(users_filter), get_projection(UserPublic), batch_size=batch_size
+    ).sort("_id", 1)
+    try:
+        batch: list[UserPublic] = []
+        async for user in cursor:
+            batch.append(UserPublic.model_validate(user))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        await cursor.close()
+
+
+async def create_item(session: AsyncIOMotorClientSession, user: User | UserPublic, item_in: ItemCreate) -> Item:
     item_data = item_in.model_dump(exclude_unset=True)
     item_data["owner_id"] = user.id
-    item_data["owner"] = user
+    item_data["owner"] = user.id
     item = Item.model_validate(item_data)
     item = await item.insert(session=session)
-    return item
\ No newline at end of file
+    return item
+
+
+async def create_items(
+    session: AsyncIOMotorClientSession, user: User | UserPublic, items_in: list[ItemCreate], ordered: bool = False
+) -> list[ItemBulkStatus]:
+    """
+    Insert a batch of items with a single insert_many and report each item's outcome.
+
+    With ordered=True the batch stops at the first failed write and the rest are
+    reported as not inserted; otherwise every item is attempted.
+    """
+    items = [
+        Item.model_validate({**item_in.model_dump(exclude_unset=True), "owner_id": user.id, "owner": user.id})
+        for item_in in items_in
+    ]
+    statuses = [ItemBulkStatus(index=index, id=item.id) for index, item in enumerate(items)]
+    if not items:
+        return statuses
+    try:
+        await Item.insert_many(items, session=session, ordered=ordered)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        for error in write_errors:
+            statuses[error["index"]] = ItemBulkStatus(index=error["index"], error=error["errmsg"])
+        if ordered and write_errors:
+            first_failed = write_errors[0]["index"]
+            for status in statuses[first_failed + 1:]:
+                status.id = None
+                status.error = "Not inserted, an earlier item in the ordered batch failed"
+    return statuses
+
+
+def items_filter_query(items_filter: ItemsFilter) -> dict[str, Any]:
+    query: dict[str, Any] = {}
+    title: dict[str, Any] = {}
+    if items_filter.title is not None:
+        title["$eq"] = items_filter.title
+    if items_filter.title_prefix is not None:
+        # an anchored, case-sensitive regex is a range scan on the title index
+        title["$regex"] = f"^{re.escape(items_filter.title_prefix)}"
+    if title:
+        query["title"] = title
+    if items_filter.has_description is not None:
+        query["description"] = {"$ne": None} if items_filter.has_description else None
+    ids: dict[str, Any] = {}
+    if items_filter.id_gte is not None:
+        ids["$gte"] = items_filter.id_gte
+    if items_filter.id_lt is not None:
+        ids["$lt"] = items_filter.id_lt
+    if ids:
+        query["_id"] = ids
+    return query
+
+
+def items_selection_query(selection: ItemsSelection, owner_id: Optional[PydanticObjectId] = None) -> dict[str, Any]:
+    query = items_filter_query(selection.filter) if selection.filter is not None else {}
+    if selection.ids is not None:
+        query.setdefault("_id", {})["$in"] = selection.ids
+    if owner_id is not None:
+        query["owner_id"] = owner_id
+    return query
+
+
+async def update_items(
+    session: AsyncIOMotorClientSession, query: dict[str, Any], item_in: ItemUpdate
+) -> tuple[int, int]:
+    """
+    Apply item_in to every item matching query with one update_many; returns (matched, modified).
+    """
+    result = await Item.find(query, session=session).update(
+        {"$set": item_in.model_dump(exclude_unset=True), "$inc": {"version": 1}}
+    )
+    return result.matched_count, result.modified_count
+
+
+async def delete_items(session: AsyncIOMotorClientSession, query: dict[str, Any]) -> int:
+    """
+    Delete every item matching query with one delete_many; returns the number deleted.
+    """
+    result = await Item.find(query, session=session).delete()
+    return result.deleted_count if result else 0
+
+
+async def read_item_public(session: Optional[AsyncIOMotorClientSession], id: PydanticObjectId) -> Optional[ItemPublic]:
+    """
+    Public fields of an item, projected in the database and not hydrated as a document.
+    """
+    item = await Item.find_one(Item.id == id, session=session).project(ItemPublic)
+    return item
+
+
+async def read_item_revision(session: Optional[AsyncIOMotorClientSession], id: PydanticObjectId) -> Optional[ItemRevision]:
+    item = await Item.find_one(Item.id == id, session=session).project(ItemRevision)
+    return item
+
+
+async def update_item(session: AsyncIOMotorClientSession, item: Item, item_in: ItemUpdate) -> Item:
+    item_data = item_in.model_dump(exclude_unset=True)
+    update: dict[str, Any] = {"$inc": {"version": 1}}
+    if item_data:
+        update["$set"] = item_data
+    await item.update(update, session=session)
+    return item
+
+
+# sort -> field and direction; ties on the field are broken by _id in the same direction
+ITEMS_SORTS: dict[ItemsSort, tuple[str, int]] = {
+    "id": ("_id", ASCENDING),
+    "-id": ("_id", DESCENDING),
+    "title": ("title", ASCENDING),
+    "-title": ("title", DESCENDING),
+}
+
+
+def items_sort_keys(sort: ItemsSort) -> list[tuple[str, int]]:
+    field, direction = ITEMS_SORTS[sort]
+    return [("_id", direction)] if field == "_id" else [(field, direction), ("_id", direction)]
+
+
+def items_sort_index(
+    sort: ItemsSort, owner_id: Optional[PydanticObjectId] = None, items_filter: Optional[ItemsFilter] = None
+) -> list[tuple[str, int]]:
+    """
+    Key pattern of the declared index to read items in this sort order with, within one
+    owner when owner_id is given; scanned backwards for descending sorts.
+
+    That is the index of the sort itself, except for a filter on title, which always
+    uses the title index: its matches are a narrow range there, whereas walking the
+    _id index for them could scan every item. An exact title keeps its matches in _id
+    order there; no index returns a title_prefix's matches in _id order, so the API
+    rejects that combination.
+    """
+    prefix = [("owner_id", ASCENDING)] if owner_id is not None else []
+    if items_filter is not None and (items_filter.title is not None or items_filter.title_prefix is not None):
+        return prefix + [("title", ASCENDING), ("_id", ASCENDING)]
+    return prefix + [(field, ASCENDING) for field, _ in items_sort_keys(sort)]
+
+
+def items_keyset_query(sort: ItemsSort, after: list[Any]) -> dict[str, Any]:
+    """
+    Items strictly after the sort key values after, in sort order.
+
+    The range on the leading key becomes index bounds; only rows tied on it are left
+    to the $or.
+    """
+    keys = items_sort_keys(sort)
+    direction = keys[0][1]
+    op = "$gt" if direction == ASCENDING else "$lt"
+    if len(keys) == 1:
+        return {"_id": {op: after[0]}}
+    field = keys[0][0]
+    return {
+        field: {op + "e": after[0]},
+        "$or": [{field: {op: after[0]}}, {"_id": {op: after[1]}}],
+    }
+
+
+async def read_items(
+    session: AsyncIOMotorClientSession,
+    owner_id: Optional[PydanticObjectId] = None,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[list[Any]] = None,
+    count_mode: CountMode = "exact",
+    items_filter: Optional[ItemsFilter] = None,
+    sort: ItemsSort = "id",
+) -> tuple[list[ItemPublic], int, bool]:
+    """
+    Page of items in sort order, the total count and whether the count is exact,
+    optionally filtered and scoped to one owner.
+
+    The page is read with a hint on the index of its sort, so the server doesn't sort
+    in memory, and filters on other fields narrow that index scan; a filter on title
+    uses the title index instead (see items_sort_index). With after (keyset
+    mode: the sort key values of the previous page's last item) the page starts right
+    after it and skip is ignored, so every page costs the same. The page and the
+    count are fetched concurrently, in one round trip of latency.
+    """
+    filter = items_filter_query(items_filter) if items_filter is not None else {}
+    if owner_id is not None:
+        filter["owner_id"] = owner_id
+    page_filter = filter
+    if after is not None:
+        keyset = items_keyset_query(sort, after)
+        page_filter = {"$and": [filter, keyset]} if filter else keyset
+    query = Item.find(page_filter, session=session, hint=items_sort_index(sort, owner_id, items_filter))
+    if after is None:
+        query = query.skip(skip)
+    (count, count_exact), items = await asyncio.gather(
+        count_documents(Item, filter, count_mode),
+        query.sort(items_sort_keys(sort)).limit(limit).project(ItemPublic).to_list(),
+    )
+    return items, count, count_exact
+
+
+async def search_items(
+    session: Optional[AsyncIOMotorClientSession],
+    q: str,
+    owner_id: Optional[PydanticObjectId] = None,
+    limit: int = 100,
+    after: Optional[tuple[float, PydanticObjectId]] = None,
+) -> list[ItemSearchResult]:
+    """
+    Items matching the text search q, by descending relevance, then _id.
+
+    after is the (score, _id) of the last result of the previous page.
+    """
+    match: dict[str, Any] = {"$text": {"$search": q}}
+    if owner_id is not None:
+        match["owner_id"] = owner_id
+    pipeline: list[dict[str, Any]] = [
+        {"$match": match},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if after is not None:
+        score, after_id = after
+        pipeline.append({"$match": {"$or": [{"score": {"$lt": score}}, {"score": score, "_id": {"$gt": after_id}}]}})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$limit": limit},
+        {"$project": {**ItemPublic.Settings.projection, "score": 1}},
+    ]
+    cursor = Item.get_motor_collection().aggregate(pipeline, session=session)
+    return [ItemSearchResult.model_validate(item) async for item in cursor]
+
+
+async def iter_items_public(
+    owner_id: Optional[PydanticObjectId] = None, batch_size: int = 1000
+) -> AsyncGenerator[list[ItemPublic], None]:
+    """
+    Stream items in _id order, one cursor batch at a time, optionally scoped to one owner.
+
+    Only one batch is held in memory; the server cursor is closed when the consumer
+    stops early, e.g. because the client went away.
+    """
+    filter: dict[str, Any] = {} if owner_id is None else {"owner_id": owner_id}
+    cursor = Item.get_motor_collection().find(filter, get_projection(ItemPublic), batch_size=batch_size).sort("_id", 1)
+    try:
+        batch: list[ItemPublic] = []
+        async for item in cursor:
+            batch.append(ItemPublic.model_validate(item))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        await cursor.close()
@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from typing import Any
+from app.db import connect, disconnect
+from app.models import User
+
+
+logger = logging.getLogger(__name__)
+
+
+async def drop_user_items(batch_size: int = 1000) -> int:
+    """
+    Remove the legacy items link array from user documents.
+
+    Ownership is tracked by Item.owner_id alone now. Users are processed in _id
+    order, one small $unset batch at a time, so this can run against a live
+    database and be interrupted and restarted safely.
+    """
+    collection = User.get_motor_collection()
+    modified = 0
+    filter: dict[str, Any] = {"items": {"$exists": True}}
+    while True:
+        ids = [
+            user["_id"]
+            async for user in collection.find(filter, {"_id": 1}).sort("_id", 1).limit(batch_size)
+        ]
+        if not ids:
+            return modified
+        result = await collection.update_many({"_id": {"$in": ids}}, {"$unset": {"items": ""}})
+        modified += result.modified_count
+        filter["_id"] = {"$gt": ids[-1]}
+
+
+async def main() -> None:
+    await connect()
+    logger.info("Dropping items arrays from users")
+    modified = await drop_user_items()
+    logger.info(f"Updated {modified} users")
+    await disconnect()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
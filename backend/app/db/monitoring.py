@@ -0,0 +1,293 @@
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Mapping, Optional
+from pymongo import monitoring
+from app.config import settings, logger
+from app.core.metrics import Counter, Histogram, registry, request_scope
+from app.models import SlowQueryShape
+
+mongo_command_duration = registry.histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency, as measured by the driver", ("command",)
+)
+mongo_command_errors = registry.counter("mongo_command_errors", "Failed MongoDB commands", ("command",))
+mongo_pool_checkout_wait = registry.histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection, successful or not"
+).labels()
+mongo_pool_checkout_failures = registry.counter(
+    "mongo_pool_checkout_failures", "Connection checkouts that failed, e.g. on waitQueueTimeoutMS", ("reason",)
+)
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    Latency and errors of every command sent on the client, by command name.
+
+    Called by the driver on Motor's worker threads, after each reply.
+    """
+    def __init__(self) -> None:
+        # command name -> (latency, errors), resolved on first use
+        self._commands: dict[str, tuple[Histogram, Counter]] = {}
+
+    def _metrics(self, command_name: str) -> tuple[Histogram, Counter]:
+        metrics = self._commands.get(command_name)
+        if metrics is None:
+            metrics = self._commands.setdefault(
+                command_name,
+                (mongo_command_duration.labels(command_name), mongo_command_errors.labels(command_name)),
+            )
+        return metrics
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._metrics(event.command_name)[0].observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        duration, errors = self._metrics(event.command_name)
+        duration.observe(event.duration_micros / 1_000_000)
+        errors.inc()
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    Connection checkout waits, and connections currently checked out of the pool.
+
+    Unlike the counters, the checked out gauge would drift for good on a lost update,
+    so it is kept under a lock.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checked_out = 0
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        with self._lock:
+            self.checked_out += 1
+        if event.duration is not None:
+            mongo_pool_checkout_wait.observe(event.duration)
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        if event.duration is not None:
+            mongo_pool_checkout_wait.observe(event.duration)
+        mongo_pool_checkout_failures.labels(event.reason).inc()
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        pass
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        pass
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        pass
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+
+def _shape(value: Any) -> str:
+    """
+    A filter with every value replaced by ?, e.g. {owner_id: ?, _id: {$gt: ?}}
+    """
+    if isinstance(value, Mapping):
+        return "{" + ", ".join(f"{key}: {_shape(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, list) and value and all(isinstance(item, Mapping) for item in value):
+        # clauses of $and, $or and $nor are filters themselves
+        return "[" + ", ".join(_shape(item) for item in value) + "]"
+    return "?"
+
+
+def _keys(value: Any) -> str:
+    if isinstance(value, Mapping):
+        return "{" + ", ".join(f"{key}: {item}" for key, item in value.items()) + "}"
+    return str(value)
+
+
+def _pipeline_shape(pipeline: list[Mapping[str, Any]]) -> str:
+    stages = []
+    for stage in pipeline:
+        for name, spec in stage.items():
+            if name == "$match":
+                stages.append(f"$match {_shape(spec)}")
+            elif name == "$sort":
+                stages.append(f"$sort {_keys(spec)}")
+            else:
+                stages.append(name)
+    return "[" + ", ".join(stages) + "]"
+
+
+def command_shape(command_name: str, command: Mapping[str, Any]) -> str:
+    """
+    What a command does without its values, so commands differing only in values aggregate.
+
+    e.g. find items {owner_id: ?} sort {_id: 1} hint {owner_id: 1, _id: 1}
+    """
+    collection = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    parts = [command_name, str(collection)]
+    if command_name in ("find", "count", "distinct", "findAndModify"):
+        parts.append(_shape(command.get("filter", command.get("query")) or {}))
+        if command.get("sort"):
+            parts.append(f"sort {_keys(command['sort'])}")
+        if command.get("hint"):
+            parts.append(f"hint {_keys(command['hint'])}")
+    elif command_name == "aggregate":
+        parts.append(_pipeline_shape(command.get("pipeline", [])))
+    elif command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or []
+        if statements:
+            parts.append(_shape(statements[0].get("q", {})))
+    return " ".join(parts)
+
+
+class _ShapeStats:
+    __slots__ = ("count", "total_ms", "max_ms", "samples", "routes", "last_seen")
+
+    def __init__(self, samples: int) -> None:
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples: deque[float] = deque(maxlen=samples)
+        self.routes: dict[str, int] = {}
+        self.last_seen = datetime.now(timezone.utc)
+
+
+def _percentile(ordered: list[float], p: float) -> float:
+    # nearest rank
+    return ordered[max(round(p / 100 * len(ordered)) - 1, 0)]
+
+
+class SlowQueryLog:
+    """
+    Slow commands aggregated by shape, in a table of at most max_shapes entries.
+
+    The least recently seen shape is dropped first. Percentiles are over the latest
+    samples durations of a shape; each shape counts the routes it came from, up to
+    MAX_ROUTES of them. Recorded from Motor's worker threads, so guarded by a lock,
+    which only slow commands ever take.
+    """
+    MAX_ROUTES = 20
+
+    def __init__(self, max_shapes: int, samples: int) -> None:
+        self.max_shapes = max_shapes
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._shapes: OrderedDict[str, _ShapeStats] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._shapes)
+
+    def record(self, shape: str, duration_ms: float, route: str) -> None:
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                stats = self._shapes[shape] = _ShapeStats(self.samples)
+                if len(self._shapes) > self.max_shapes:
+                    self._shapes.popitem(last=False)
+            else:
+                self._shapes.move_to_end(shape)
+                stats.last_seen = datetime.now(timezone.utc)
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.samples.append(duration_ms)
+            if route in stats.routes or len(stats.routes) < self.MAX_ROUTES:
+                stats.routes[route] = stats.routes.get(route, 0) + 1
+
+    def top(self, limit: int) -> list[SlowQueryShape]:
+        """
+        The limit shapes with the highest p99
+        """
+        with self._lock:
+            snapshot = [
+                (shape, stats.count, stats.total_ms, stats.max_ms, sorted(stats.samples), dict(stats.routes), stats.last_seen)
+                for shape, stats in self._shapes.items()
+            ]
+        shapes = [
+            SlowQueryShape(
+                shape=shape,
+                count=count,
+                total_ms=total_ms,
+                p50_ms=_percentile(samples, 50),
+                p99_ms=_percentile(samples, 99),
+                max_ms=max_ms,
+                routes=routes,
+                last_seen=last_seen,
+            )
+            for shape, count, total_ms, max_ms, samples, routes, last_seen in snapshot
+        ]
+        shapes.sort(key=lambda shape: shape.p99_ms, reverse=True)
+        return shapes[:limit]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+
+
+def _current_route() -> str:
+    scope = request_scope.get()
+    if scope is None:
+        return "background"
+    return f"{scope['method']} {getattr(scope.get('route'), 'path', None) or 'unmatched'}"
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """
+    Log and aggregate commands slower than SLOW_QUERY_THRESHOLD_MS.
+
+    Reply events don't carry the command, so started() keeps a reference to it until
+    its reply; the shape is only computed for the slow ones. The driver calls the
+    listener in the context of the request that sent the command.
+    """
+    def __init__(self, log: SlowQueryLog) -> None:
+        self.log = log
+        # request id -> (command name, command) of commands awaiting their reply
+        self._pending: dict[int, tuple[str, Mapping[str, Any]]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if settings.SLOW_QUERY_THRESHOLD_MS is not None:
+            self._pending[event.request_id] = (event.command_name, event.command)
+
+    def _finished(self, event: monitoring.CommandSucceededEvent | monitoring.CommandFailedEvent) -> None:
+        started = self._pending.pop(event.request_id, None)
+        threshold: Optional[float] = settings.SLOW_QUERY_THRESHOLD_MS
+        duration_ms = event.duration_micros / 1000
+        if started is None or threshold is None or duration_ms < threshold:
+            return
+        shape = command_shape(*started)
+        route = _current_route()
+        logger.warning(f"Slow query, {duration_ms:.1f} ms: {shape} from {route}")
+        self.log.record(shape, duration_ms, route)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event)
+
+
+# shared by every client the process creates, see app.db.connect
+command_metrics = CommandMetricsListener()
+pool_metrics = PoolMetricsListener()
+slow_query_log = SlowQueryLog(max_shapes=settings.SLOW_QUERY_MAX_SHAPES, samples=settings.SLOW_QUERY_SAMPLES)
+slow_queries = SlowQueryListener(slow_query_log)
+
+registry.callback(
+    "mongo_pool_checked_out_connections", "Connections currently checked out of the pool", "gauge",
+    lambda: [((), pool_metrics.checked_out)],
+)
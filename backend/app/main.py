@@ -3,10 +3,17 @@ from fastapi import FastAPI
 from fastapi.responses import PlainTextResponse
 from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 from contextlib import asynccontextmanager
 from app.config import settings
-from app.db import get_session, init_db
+from app.core import security
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.db import connect, disconnect, get_session, init_db
 from app.api import api_router
+from app.api.profiling import ProfilingMiddleware
+from app.announcements import start_interrupted_sweep, stop_announcements
+from app.outbox import outbox_worker
+from app.utils import load_email_templates
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -19,9 +26,17 @@ if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await connect()
     async for session in get_session():
         await init_db(session=session)
+    start_interrupted_sweep()
+    await load_email_templates()
+    outbox_worker.start()
     yield
+    await stop_announcements()
+    await outbox_worker.stop()
+    await disconnect()
+    security.shutdown_executor()
 
 
 app = FastAPI(title=settings.PROJECT_NAME, 
@@ -41,4 +56,25 @@ if settings.BACKEND_CORS_ORIGINS:
     )
 
 
-app.include_router(router=api_router, prefix=settings.API_V1_STR)
\ No newline at end of file
+app.include_router(router=api_router, prefix=settings.API_V1_STR)
+
+
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", tags=["metrics"], include_in_schema=False)
+    async def read_metrics() -> PlainTextResponse:
+        """
+        Metrics in the Prometheus text exposition format, for a scraper on the internal network;
+        outside /api, so the proxy does not route it publicly.
+        """
+        return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+
+# outermost, so everything inside sees the client behind the proxy, e.g. the login throttle;
+# uvicorn types it with its own ASGI protocols rather than Starlette's
+app.add_middleware(ProxyHeadersMiddleware, trusted_hosts=settings.FORWARDED_ALLOW_IPS)  # type: ignore[arg-type]
@@ -1,6 +1,17 @@
-from beanie import Document, Link, PydanticObjectId, before_event, after_event, Delete, Insert
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from beanie import Document, Link, PydanticObjectId, before_event, Delete
+from pymongo import ASCENDING, TEXT, IndexModel
+from pydantic import AliasChoices, BaseModel, EmailStr, Field
+from datetime import datetime, timezone
+from typing import Literal, Optional, List
+from app.config import settings
+
+
+CountMode = Literal["exact", "estimated", "capped"]
+EmailStatus = Literal["queued", "sending", "sent", "dead"]
+ItemsSort = Literal["id", "-id", "title", "-title"]
+AnnouncementStatus = Literal["running", "done", "failed", "cancelled"]
+ProfileFormat = Literal["speedscope", "collapsed"]
+
 
 class UserBase(BaseModel):
     """
@@ -54,10 +65,13 @@ class UpdatePassword(BaseModel):
 class User(Document, UserBase):
     """
     Database model, database table inferred from class name
+
+    A user's items are not stored on the user; they are looked up through the
+    (owner_id, _id) index on items.
     """
     id: PydanticObjectId = Field(default_factory=PydanticObjectId)
     hashed_password: str
-    items: List[Link["Item"]] = Field(default_factory=list)
+    version: int = 0  # bumped by every update, the basis of the user's ETag
 
     class Settings:
         name = "users"
@@ -72,8 +86,25 @@ class User(Document, UserBase):
 class UserPublic(UserBase):
     """
     Properties to return via API, id is always required
+
+    Also used as a Beanie projection model, so list and detail reads fetch only
+    these fields and decode the raw documents (keyed by _id) straight into it.
+    """
+    id: PydanticObjectId = Field(validation_alias=AliasChoices("id", "_id"))
+
+    class Settings:
+        projection = {"email": 1, "is_active": 1, "is_superuser": 1, "full_name": 1}
+
+
+class UserRevision(BaseModel):
     """
-    id: PydanticObjectId
+    Projection of what a conditional GET of a user needs, without the user itself
+    """
+    id: PydanticObjectId = Field(validation_alias=AliasChoices("id", "_id"))
+    version: int = 0
+
+    class Settings:
+        projection = {"version": 1}
 
 
 class UsersPublic(BaseModel):
@@ -82,6 +113,8 @@ class UsersPublic(BaseModel):
     """
     data: List[UserPublic]
     count: int
+    count_exact: bool = True
+    next_cursor: Optional[str] = None
 
 
 class Message(BaseModel):
@@ -129,6 +162,14 @@ class ItemCreate(ItemBase):
     pass
 
 
+class ItemsBulkCreate(BaseModel):
+    """
+    Batch of items to create in one request
+    """
+    data: List[ItemCreate] = Field(max_length=settings.ITEMS_BULK_MAX_SIZE)
+    ordered: bool = False
+
+
 class ItemUpdate(ItemBase):
     """
     Properties to receive on item update
@@ -140,33 +181,59 @@ class Item(Document, ItemBase):
     id: PydanticObjectId = Field(default_factory=PydanticObjectId)
     owner_id: PydanticObjectId
     owner: Link[User]
+    version: int = 0  # bumped by every update, the basis of the item's ETag
 
     class Settings:
         name = "items"
+        # one index per supported sort, scoped and unscoped; title filters use the title ones
+        # whatever the sort (see crud.items_sort_index)
         indexes = [
-            "title",
-            "owner_id"
+            [("owner_id", ASCENDING), ("_id", ASCENDING)],
+            [("owner_id", ASCENDING), ("title", ASCENDING), ("_id", ASCENDING)],
+            [("title", ASCENDING), ("_id", ASCENDING)],
+            # a collection has at most one text index; owner scoping is a filter on its matches
+            IndexModel([("title", TEXT), ("description", TEXT)], name="title_description_text"),
         ]
-        
-    @after_event(Insert)
-    async def userlink_insert(self) -> None:
-        owner = await User.get(self.owner_id)
-        owner.items.append(self.to_ref())
-        await owner.set({"items": owner.items})
-
-    @before_event(Delete)
-    async def userlink_delete(self) -> None:
-        owner = await User.get(self.owner_id)
-        owner.items = [link for link in owner.items if link.ref.id != self.id]
-        await owner.set({"items": owner.items})
 
 
 class ItemPublic(ItemBase):
     """
     Properties to return via API, id is always required
+
+    Also used as a Beanie projection model, see UserPublic.
+    """
+    id: PydanticObjectId = Field(validation_alias=AliasChoices("id", "_id"))
+    owner_id: PydanticObjectId
+
+    class Settings:
+        projection = {"title": 1, "description": 1, "owner_id": 1}
+
+
+class ItemRevision(BaseModel):
     """
-    id: PydanticObjectId
+    Projection of what a conditional GET of an item needs, without the item itself
+    """
+    id: PydanticObjectId = Field(validation_alias=AliasChoices("id", "_id"))
     owner_id: PydanticObjectId
+    version: int = 0
+
+    class Settings:
+        projection = {"owner_id": 1, "version": 1}
+
+
+class ItemSearchResult(ItemPublic):
+    """
+    Item matching a search, with its text relevance score
+    """
+    score: float
+
+
+class ItemsSearchResults(BaseModel):
+    """
+    Page of search results, most relevant first
+    """
+    data: List[ItemSearchResult]
+    next_cursor: Optional[str] = None
 
 
 class ItemsPublic(BaseModel):
@@ -175,3 +242,232 @@ class ItemsPublic(BaseModel):
     """
     data: List[ItemPublic]
     count: int
+    count_exact: bool = True
+    next_cursor: Optional[str] = None
+
+
+class ItemBulkStatus(BaseModel):
+    """
+    Outcome of one item of a bulk create, by its position in the request
+    """
+    index: int
+    id: Optional[PydanticObjectId] = None
+    error: Optional[str] = None
+
+
+class ItemsBulkCreated(BaseModel):
+    """
+    Per-item outcome of a bulk create
+    """
+    data: List[ItemBulkStatus]
+    inserted: int
+    failed: int
+
+
+class ItemsFilter(BaseModel):
+    """
+    Selects items by their fields, unset fields don't restrict the selection
+    """
+    title: Optional[str] = None
+    title_prefix: Optional[str] = None
+    has_description: Optional[bool] = None
+    id_gte: Optional[PydanticObjectId] = None
+    id_lt: Optional[PydanticObjectId] = None
+
+
+class ItemsSelection(BaseModel):
+    """
+    Items to act on, by id and/or filter, always within the caller's own items
+    unless the caller is a superuser
+    """
+    ids: Optional[List[PydanticObjectId]] = Field(default=None, max_length=settings.ITEMS_BULK_MAX_SIZE)
+    filter: Optional[ItemsFilter] = None
+
+
+class ItemsBulkUpdate(ItemsSelection):
+    """
+    Properties to set on every selected item
+    """
+    update: ItemUpdate
+
+
+class ItemsBulkDelete(ItemsSelection):
+    """
+    Items to delete
+    """
+    pass
+
+
+class ItemsBulkWriteResult(BaseModel):
+    """
+    Number of items selected and changed by a bulk update or delete
+    """
+    matched: int
+    modified: int
+
+
+class ItemsImportError(BaseModel):
+    """
+    Line of an import that was not inserted, numbered from 1
+    """
+    line: int
+    error: str
+
+
+class ItemsImported(BaseModel):
+    """
+    Outcome of an NDJSON import
+    """
+    inserted: int
+    failed: int
+    errors: List[ItemsImportError]
+
+
+class EmailOutbox(Document):
+    """
+    Email waiting for, or done with, delivery by the outbox worker
+
+    queued and sending messages are due at next_attempt_at; for sending that is the end
+    of the worker's lease, after which another worker may retry it. Sent messages drop
+    their content, which may hold a password, and sent and dead messages are deleted by
+    MongoDB at expires_at.
+    """
+    id: PydanticObjectId = Field(default_factory=PydanticObjectId)
+    email_to: EmailStr
+    subject: str
+    html_content: Optional[str]
+    status: EmailStatus = "queued"
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    sent_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+
+    class Settings:
+        name = "email_outbox"
+        indexes = [
+            [("status", ASCENDING), ("next_attempt_at", ASCENDING)],
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+
+class UsersFilter(BaseModel):
+    """
+    Selects users by their fields, unset fields don't restrict the selection
+    """
+    is_active: Optional[bool] = True
+    is_superuser: Optional[bool] = None
+    email_domain: Optional[str] = None
+
+
+class AnnouncementCreate(BaseModel):
+    """
+    Email to send to every user matching filter; message is HTML
+    """
+    subject: str = Field(min_length=1, max_length=255)
+    message: str = Field(min_length=1)
+    filter: UsersFilter = Field(default_factory=UsersFilter)
+
+
+class Announcement(Document, AnnouncementCreate):
+    """
+    Announcement and the progress of its delivery
+
+    deferred counts messages that failed on the direct path and were handed to the
+    email outbox for retries, failed those that could not even be queued there. A
+    running announcement is delivered by the process runner_id, which renews its lease
+    until lease_until.
+    """
+    id: PydanticObjectId = Field(default_factory=PydanticObjectId)
+    status: AnnouncementStatus = "running"
+    total: Optional[int] = None
+    sent: int = 0
+    deferred: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: Optional[datetime] = None
+    runner_id: Optional[str] = None
+    lease_until: Optional[datetime] = None
+
+    class Settings:
+        name = "announcements"
+
+
+class AnnouncementPublic(BaseModel):
+    """
+    Properties to return via API, the message itself is left out
+    """
+    id: PydanticObjectId = Field(validation_alias=AliasChoices("id", "_id"))
+    subject: str
+    filter: UsersFilter
+    status: AnnouncementStatus
+    total: Optional[int]
+    sent: int
+    deferred: int
+    failed: int
+    error: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+
+    class Settings:
+        projection = {
+            "subject": 1,
+            "filter": 1,
+            "status": 1,
+            "total": 1,
+            "sent": 1,
+            "deferred": 1,
+            "failed": 1,
+            "error": 1,
+            "created_at": 1,
+            "finished_at": 1,
+        }
+
+
+class SlowQueryShape(BaseModel):
+    """
+    Database commands of one shape that took longer than SLOW_QUERY_THRESHOLD_MS
+    """
+    shape: str
+    count: int
+    total_ms: float
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+    # "METHOD /route/template" that issued them -> count; "background" outside a request
+    routes: dict[str, int]
+    last_seen: datetime
+
+
+class SlowQueries(BaseModel):
+    """
+    Slowest query shapes, by descending p99
+    """
+    data: List[SlowQueryShape]
+    count: int
+
+
+class ProfileSummary(BaseModel):
+    """
+    A request profiled on demand with the X-Profile header
+    """
+    id: str
+    method: str
+    path: str
+    # route template, None when no route matched
+    route: Optional[str]
+    status: int
+    started_at: datetime
+    duration_ms: float
+    cpu_ms: float
+    samples: int
+
+
+class Profiles(BaseModel):
+    """
+    Stored request profiles, most recent first
+    """
+    data: List[ProfileSummary]
+    count: int
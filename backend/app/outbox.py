@@ -0,0 +1,214 @@
+import asyncio
+import contextlib
+import smtplib
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Any, Optional
+from pymongo import ASCENDING, ReturnDocument
+from app.config import settings, logger
+from app.core.metrics import registry
+from app.models import EmailOutbox
+
+email_deliveries = registry.counter(
+    "email_deliveries", "Email delivery attempts by channel (outbox, announcement) and outcome", ("channel", "outcome")
+)
+_outbox_sent = email_deliveries.labels("outbox", "sent")
+_outbox_retried = email_deliveries.labels("outbox", "retried")
+_outbox_dead = email_deliveries.labels("outbox", "dead")
+
+
+class SMTPConnection:
+    """
+    SMTP connection opened on first use and reused for the messages that follow.
+
+    smtplib is blocking, so the methods are meant to run in a worker thread.
+    """
+    def __init__(self) -> None:
+        self._smtp: Optional[smtplib.SMTP] = None
+
+    def _open(self) -> smtplib.SMTP:
+        assert settings.SMTP_HOST, "no provided configuration for email variables"
+        if settings.SMTP_SSL:
+            smtp: smtplib.SMTP = smtplib.SMTP_SSL(
+                settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS
+            )
+        else:
+            smtp = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+            if settings.SMTP_TLS:
+                smtp.starttls()
+        if settings.SMTP_USER:
+            smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD or "")
+        return smtp
+
+    def send(self, message: EmailMessage) -> None:
+        reused = self._smtp is not None
+        if self._smtp is None:
+            self._smtp = self._open()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # The server may drop a connection that sat idle; retry once on a fresh one
+            self._smtp = None
+            if not reused:
+                raise
+            self._smtp = self._open()
+            self._smtp.send_message(message)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+            # The server rejected this message, the connection itself is still fine
+            raise
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._smtp is None:
+            return
+        smtp, self._smtp = self._smtp, None
+        try:
+            smtp.quit()
+        except OSError:
+            smtp.close()
+
+
+def build_message(*, email_to: str, subject: str, html_content: str) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = formataddr((settings.EMAILS_FROM_NAME or "", settings.EMAILS_FROM_EMAIL or ""))
+    message["To"] = email_to
+    message.set_content(html_content, subtype="html")
+    return message
+
+
+async def retry_delay(attempts: int) -> timedelta:
+    """
+    Exponential backoff after the given number of failed attempts
+    """
+    seconds = settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, settings.EMAIL_OUTBOX_RETRY_MAX_SECONDS))
+
+
+def claim_arguments(now: datetime) -> dict[str, Any]:
+    """
+    Filter, update and sort of the find_one_and_update claiming the next message due at now
+    """
+    return {
+        "filter": {"status": {"$in": ["queued", "sending"]}, "next_attempt_at": {"$lte": now}},
+        "update": {
+            "$set": {
+                "status": "sending",
+                "next_attempt_at": now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS),
+            },
+            "$inc": {"attempts": 1},
+        },
+        "sort": [("next_attempt_at", ASCENDING)],
+    }
+
+
+class OutboxWorker:
+    """
+    Background task delivering EmailOutbox messages.
+
+    Messages are claimed one at a time with an atomic find_one_and_update, so several
+    application processes can each run a worker. A burst of messages shares one SMTP
+    connection, closed again once nothing is due. Failed deliveries are retried with
+    exponential backoff and dead-lettered after EMAIL_OUTBOX_MAX_ATTEMPTS.
+    """
+    def __init__(self) -> None:
+        self._connection = SMTPConnection()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # A message cancelled mid-delivery stays sending and is retried after its lease
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await asyncio.to_thread(self._connection.close)
+
+    def notify(self) -> None:
+        """
+        Wake the worker up for a newly queued message
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def claim(self) -> Optional[EmailOutbox]:
+        """
+        Take the next due message, marking it sending for the length of a lease
+        """
+        document = await EmailOutbox.get_motor_collection().find_one_and_update(
+            **claim_arguments(datetime.now(timezone.utc)), return_document=ReturnDocument.AFTER
+        )
+        if document is None:
+            return None
+        return EmailOutbox.model_validate(document)
+
+    async def deliver(self, email: EmailOutbox) -> bool:
+        try:
+            message = build_message(email_to=email.email_to, subject=email.subject, html_content=email.html_content or "")
+            await asyncio.to_thread(self._connection.send, message)
+        except Exception as e:
+            now = datetime.now(timezone.utc)
+            update: dict[str, Any]
+            if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                logger.error(f"Email {email.id} to {email.email_to} dead after {email.attempts} attempts: {e!r}")
+                # kept for inspection until it expires
+                update = {
+                    "status": "dead",
+                    "last_error": repr(e),
+                    "expires_at": now + timedelta(seconds=settings.EMAIL_OUTBOX_RETENTION_SECONDS),
+                }
+                _outbox_dead.inc()
+            else:
+                logger.warning(f"Email {email.id} to {email.email_to} failed, attempt {email.attempts}: {e!r}")
+                update = {
+                    "status": "queued",
+                    "next_attempt_at": now + await retry_delay(email.attempts),
+                    "last_error": repr(e),
+                }
+                _outbox_retried.inc()
+            await email.set(update)
+            return False
+        _outbox_sent.inc()
+        now = datetime.now(timezone.utc)
+        await email.set({
+            "status": "sent",
+            "sent_at": now,
+            "last_error": None,
+            "html_content": None,
+            "expires_at": now + timedelta(seconds=settings.EMAIL_OUTBOX_RETENTION_SECONDS),
+        })
+        return True
+
+    async def deliver_due(self) -> int:
+        """
+        Deliver every message due now; returns how many were delivered
+        """
+        delivered = 0
+        while (email := await self.claim()) is not None:
+            delivered += await self.deliver(email)
+        return delivered
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.deliver_due()
+            except Exception:
+                logger.exception("Email outbox delivery failed")
+            finally:
+                await asyncio.to_thread(self._connection.close)
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), settings.EMAIL_OUTBOX_POLL_SECONDS)
+
+
+outbox_worker = OutboxWorker()
@@ -1,9 +1,13 @@
+import json
 import pytest
+from unittest.mock import patch
 from httpx import AsyncClient
 from beanie import PydanticObjectId
 from app.config import settings
 from app.db import get_session
-from app.tests.utils import create_random_item
+from app.db import crud
+from app.models import ItemCreate, UserCreate
+from app.tests.utils import create_random_item, random_email, random_lower_string, user_authentication_headers
 
 
 @pytest.mark.asyncio
@@ -25,6 +29,38 @@ async def test_create_item(client: AsyncClient, superuser_token_headers: dict[st
     assert "owner_id" in content
 
 
+@pytest.mark.asyncio
+async def test_create_items_bulk(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    data = {"data": [{"title": "Foo"}, {"title": "Bar", "description": "Baz"}]}
+    response = await client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["inserted"] == 2
+    assert content["failed"] == 0
+    assert [status["index"] for status in content["data"]] == [0, 1]
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/{content['data'][1]['id']}",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["description"] == "Baz"
+
+
+@pytest.mark.asyncio
+async def test_create_items_bulk_too_many(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    # the limit is part of the request model, so it is checked while the body is validated
+    response = await client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=superuser_token_headers,
+        json={"data": [{"title": "Foo"}] * (settings.ITEMS_BULK_MAX_SIZE + 1)},
+    )
+    assert response.status_code == 422
+
+
 @pytest.mark.asyncio
 async def test_read_item(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
     item = None
@@ -42,6 +78,37 @@ async def test_read_item(client: AsyncClient, superuser_token_headers: dict[str,
     assert content["owner_id"] == str(item.owner_id)
 
 
+@pytest.mark.asyncio
+async def test_read_item_etag(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    item = None
+    async for session in get_session():
+        item = await create_random_item(session=session)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    response = await client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    response = await client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert not response.content
+    response = await client.put(url, headers=superuser_token_headers, json={"title": "Changed"})
+    assert response.status_code == 200
+    response = await client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["title"] == "Changed"
+
+
+@pytest.mark.asyncio
+async def test_read_items_etag(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    response = await client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    response = await client.get(url, headers={**superuser_token_headers, "If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+
+
 @pytest.mark.asyncio
 async def test_read_item_not_found(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
     response = await client.get(
@@ -81,6 +148,256 @@ async def test_read_items(client: AsyncClient, superuser_token_headers: dict[str
     assert len(content["data"]) >= 2
 
 
+@pytest.mark.asyncio
+async def test_read_items_cursor(client: AsyncClient) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    async for session in get_session():
+        user = await crud.create_user(session=session, user_create=UserCreate(email=email, password=password))
+        for title in ("a", "b", "c"):
+            await crud.create_item(session=session, user=user, item_in=ItemCreate(title=title))
+    headers = await user_authentication_headers(client=client, email=email, password=password)
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=headers,
+        params={"limit": 2},
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert first_page["count"] == 3
+    assert [item["title"] for item in first_page["data"]] == ["a", "b"]
+    assert first_page["next_cursor"]
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=headers,
+        params={"limit": 2, "cursor": first_page["next_cursor"]},
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    assert second_page["count"] == 3
+    assert [item["title"] for item in second_page["data"]] == ["c"]
+    assert second_page["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_search_items(client: AsyncClient) -> None:
+    word = await random_lower_string()
+    email = await random_email()
+    password = await random_lower_string()
+    async for session in get_session():
+        user = await crud.create_user(session=session, user_create=UserCreate(email=email, password=password))
+        other_item = await create_random_item(session=session)
+        await other_item.set({"title": word})
+        await crud.create_item(session=session, user=user, item_in=ItemCreate(title=f"{word} {word}"))
+        await crud.create_item(session=session, user=user, item_in=ItemCreate(title="a", description=word))
+        await crud.create_item(session=session, user=user, item_in=ItemCreate(title="b"))
+    headers = await user_authentication_headers(client=client, email=email, password=password)
+    response = await client.get(f"{settings.API_V1_STR}/items/search", headers=headers, params={"q": word, "limit": 1})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [item["title"] for item in first_page["data"]] == [f"{word} {word}"]
+    assert first_page["next_cursor"]
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/search",
+        headers=headers,
+        params={"q": word, "limit": 1, "cursor": first_page["next_cursor"]},
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    assert [item["title"] for item in second_page["data"]] == ["a"]
+    assert second_page["data"][0]["score"] <= first_page["data"][0]["score"]
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/search",
+        headers=headers,
+        params={"q": word, "limit": 1, "cursor": second_page["next_cursor"]},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"data": [], "next_cursor": None}
+
+
+@pytest.mark.asyncio
+async def test_search_items_invalid_cursor(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/search",
+        headers=superuser_token_headers,
+        params={"q": "foo", "cursor": "not-a-cursor"},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_read_items_sort_title_cursor(client: AsyncClient) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    async for session in get_session():
+        user = await crud.create_user(session=session, user_create=UserCreate(email=email, password=password))
+        for title in ("c", "a", "b", "a"):
+            await crud.create_item(session=session, user=user, item_in=ItemCreate(title=title))
+    headers = await user_authentication_headers(client=client, email=email, password=password)
+    titles = []
+    cursor = None
+    while True:
+        params = {"limit": 3, "sort": "-title"} | ({"cursor": cursor} if cursor else {})
+        response = await client.get(f"{settings.API_V1_STR}/items/", headers=headers, params=params)
+        assert response.status_code == 200
+        page = response.json()
+        titles += [item["title"] for item in page["data"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert titles == ["c", "b", "a", "a"]
+
+
+@pytest.mark.asyncio
+async def test_read_items_filters(client: AsyncClient) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    async for session in get_session():
+        user = await crud.create_user(session=session, user_create=UserCreate(email=email, password=password))
+        items = [
+            await crud.create_item(session=session, user=user, item_in=ItemCreate(title=title, description=description))
+            for title, description in (("apple", "red"), ("apricot", None), ("banana", "yellow"), ("avocado", "green"))
+        ]
+    headers = await user_authentication_headers(client=client, email=email, password=password)
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=headers,
+        params={"title_prefix": "a", "has_description": True, "sort": "title"},
+    )
+    assert response.status_code == 200
+    assert [item["title"] for item in response.json()["data"]] == ["apple", "avocado"]
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=headers,
+        params={"id_gte": str(items[1].id), "id_lt": str(items[3].id)},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert [item["title"] for item in content["data"]] == ["apricot", "banana"]
+    assert content["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_read_items_unsupported_sort(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/", headers=superuser_token_headers, params={"sort": "description"}
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sort", ["id", "-id"])
+async def test_read_items_title_prefix_with_id_sort(
+    client: AsyncClient, superuser_token_headers: dict[str, str], sort: str
+) -> None:
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/", headers=superuser_token_headers, params={"title_prefix": "a", "sort": sort}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "title_prefix can't be combined with an id sort"
+
+
+@pytest.mark.asyncio
+async def test_read_items_cursor_of_other_sort(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    response = await client.get(f"{settings.API_V1_STR}/items/", headers=superuser_token_headers, params={"limit": 1})
+    cursor = response.json()["next_cursor"]
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"limit": 1, "sort": "title", "cursor": cursor},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_read_items_capped_count(client: AsyncClient) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    async for session in get_session():
+        user = await crud.create_user(session=session, user_create=UserCreate(email=email, password=password))
+        for title in ("a", "b", "c"):
+            await crud.create_item(session=session, user=user, item_in=ItemCreate(title=title))
+    headers = await user_authentication_headers(client=client, email=email, password=password)
+    with patch("app.config.settings.COUNT_CAP", 2):
+        response = await client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=headers,
+            params={"count_mode": "capped"},
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count"] == 2
+    assert content["count_exact"] is False
+    assert len(content["data"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_read_items_invalid_cursor(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert response.status_code == 400
+    content = response.json()
+    assert content["detail"] == "Invalid cursor"
+
+
+@pytest.mark.asyncio
+async def test_export_items(client: AsyncClient) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    async for session in get_session():
+        user = await crud.create_user(session=session, user_create=UserCreate(email=email, password=password))
+        for title in ("a", "b", "c"):
+            await crud.create_item(session=session, user=user, item_in=ItemCreate(title=title))
+    headers = await user_authentication_headers(client=client, email=email, password=password)
+    with patch("app.config.settings.ITEMS_EXPORT_BATCH_SIZE", 2):
+        response = await client.get(f"{settings.API_V1_STR}/items/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["title"] for item in items] == ["a", "b", "c"]
+    assert all(item["owner_id"] == str(user.id) for item in items)
+
+    response = await client.get(f"{settings.API_V1_STR}/items/export", headers=headers, params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "id,title,description,owner_id"
+    assert len(lines) == 4
+
+
+@pytest.mark.asyncio
+async def test_import_items(client: AsyncClient) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    async for session in get_session():
+        await crud.create_user(session=session, user_create=UserCreate(email=email, password=password))
+    headers = await user_authentication_headers(client=client, email=email, password=password)
+    lines = [
+        json.dumps({"title": "a"}),
+        json.dumps({"description": "no title"}),
+        "",
+        json.dumps({"title": "b", "description": "c"}),
+        "not json",
+        json.dumps({"title": "d"}),
+    ]
+    with patch("app.config.settings.ITEMS_IMPORT_BATCH_SIZE", 2):
+        response = await client.post(
+            f"{settings.API_V1_STR}/items/import",
+            headers={**headers, "Content-Type": "application/x-ndjson"},
+            content="\n".join(lines).encode(),
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["inserted"] == 3
+    assert content["failed"] == 2
+    assert [error["line"] for error in content["errors"]] == [2, 5]
+    response = await client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+    assert [item["title"] for item in response.json()["data"]] == ["a", "b", "d"]
+
+
 @pytest.mark.asyncio
 async def test_update_item(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
     item = None
@@ -138,6 +455,87 @@ async def test_update_item_not_enough_permissions(client: AsyncClient, normal_us
     assert content["detail"] == "Not enough permissions"
 
 
+@pytest.mark.asyncio
+async def test_update_items_bulk(client: AsyncClient) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    other_item = None
+    async for session in get_session():
+        user = await crud.create_user(session=session, user_create=UserCreate(email=email, password=password))
+        for title in ("bulk-a", "bulk-b", "other"):
+            await crud.create_item(session=session, user=user, item_in=ItemCreate(title=title))
+        other_item = await create_random_item(session=session)
+    headers = await user_authentication_headers(client=client, email=email, password=password)
+    response = await client.patch(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=headers,
+        json={"filter": {"title_prefix": "bulk-"}, "update": {"description": "Updated"}},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"matched": 2, "modified": 2}
+    response = await client.patch(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=headers,
+        json={"ids": [str(other_item.id)], "update": {"description": "Updated"}},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"matched": 0, "modified": 0}
+
+
+@pytest.mark.asyncio
+async def test_update_items_bulk_no_selection(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    response = await client.patch(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=superuser_token_headers,
+        json={"update": {"description": "Updated"}},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Select items by ids or filter"
+
+
+@pytest.mark.asyncio
+async def test_delete_items_bulk_too_many_ids(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    response = await client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=superuser_token_headers,
+        json={"ids": ["000000000000000000000000"] * (settings.ITEMS_BULK_MAX_SIZE + 1)},
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_delete_items_bulk_empty_filter(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    response = await client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=superuser_token_headers,
+        json={"filter": {}},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == "The filter must restrict the selection"
+
+
+@pytest.mark.asyncio
+async def test_delete_items_bulk(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    items = []
+    async for session in get_session():
+        items = [await create_random_item(session=session) for _ in range(2)]
+    response = await client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=superuser_token_headers,
+        json={"ids": [str(item.id) for item in items]},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"matched": 2, "modified": 2}
+    response = await client.get(
+        f"{settings.API_V1_STR}/items/{items[0].id}",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 404
+
+
 @pytest.mark.asyncio
 async def test_delete_item(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
     item = None
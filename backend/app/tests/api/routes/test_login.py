@@ -4,7 +4,9 @@ from httpx import AsyncClient
 from app.config import settings
 from app.db import crud, get_session
 from app.utils import generate_password_reset_token
+from app.core.ratelimit import login_ip_limiter, login_user_limiter
 from app.core.security import verify_password
+from app.models import UserCreate
 from app.tests.utils import random_email
 
 
@@ -31,6 +33,46 @@ async def test_get_access_token_incorrect_password(client: AsyncClient) -> None:
     assert r.status_code == 400
 
 
+@pytest.mark.asyncio
+async def test_get_access_token_throttled(client: AsyncClient) -> None:
+    login_data = {"username": await random_email(), "password": "incorrect"}
+    with patch.object(login_user_limiter, "capacity", 2):
+        for _ in range(2):
+            r = await client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+            assert r.status_code == 400
+        r = await client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 429
+    assert int(r.headers["retry-after"]) >= 1
+
+
+@pytest.mark.asyncio
+async def test_get_access_token_throttled_per_forwarded_client(client: AsyncClient) -> None:
+    # the test client connects from 127.0.0.1, a trusted proxy by default
+    first, second = {"X-Forwarded-For": "203.0.113.1"}, {"X-Forwarded-For": "203.0.113.2"}
+    with patch.object(login_ip_limiter, "capacity", 1):
+        for headers in (first, second):
+            login_data = {"username": await random_email(), "password": "incorrect"}
+            r = await client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data, headers=headers)
+            assert r.status_code == 400
+        login_data = {"username": await random_email(), "password": "incorrect"}
+        r = await client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data, headers=first)
+    assert r.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_get_access_token_inactive_user(client: AsyncClient) -> None:
+    login_data = {"username": await random_email(), "password": "password"}
+    async for session in get_session():
+        await crud.create_user(
+            session=session,
+            user_create=UserCreate(email=login_data["username"], password=login_data["password"], is_active=False),
+        )
+    with patch("app.config.settings.LOGIN_RATE_LIMIT_ENABLED", True):
+        r = await client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Inactive user"
+
+
 @pytest.mark.asyncio
 async def test_use_access_token(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
     r = await client.post(
@@ -5,8 +5,9 @@ from beanie import PydanticObjectId
 from app.config import settings
 from app.db import crud, get_session
 from app.models import UserCreate
+from app.core.cache import principal_cache
 from app.core.security import verify_password
-from app.tests.utils import random_email, random_lower_string
+from app.tests.utils import random_email, random_lower_string, user_authentication_headers
 
 
 @pytest.mark.asyncio
@@ -76,6 +77,23 @@ async def test_get_existing_user(client: AsyncClient, superuser_token_headers: d
     assert existing_user.email == api_user["email"]
 
 
+@pytest.mark.asyncio
+async def test_get_existing_user_etag(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    user_in = UserCreate(email=await random_email(), password=await random_lower_string())
+    async for session in get_session():
+        user = await crud.create_user(session=session, user_create=user_in)
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    r = await client.get(url, headers=superuser_token_headers)
+    etag = r.headers["etag"]
+    r = await client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    r = await client.patch(url, headers=superuser_token_headers, json={"full_name": "Updated"})
+    assert r.status_code == 200
+    r = await client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
+
+
 @pytest.mark.asyncio
 async def test_get_existing_user_current_user(client: AsyncClient) -> None:
     email = await random_email()
@@ -366,6 +384,43 @@ async def test_update_user(client: AsyncClient, superuser_token_headers: dict[st
     assert user.full_name == "Updated_full_name"
 
 
+@pytest.mark.asyncio
+async def test_update_user_invalidates_cached_principal(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = None
+    async for session in get_session():
+        user = await crud.create_user(session=session, user_create=user_in)
+    headers = await user_authentication_headers(client=client, email=email, password=password)
+    r = await client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+
+    r = await client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_active": False},
+    )
+    assert r.status_code == 200
+    r = await client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Inactive user"
+
+
+@pytest.mark.asyncio
+async def test_update_user_me_reads_user_once(client: AsyncClient, normal_user_token_headers: dict[str, str]) -> None:
+    principal_cache.clear()
+    with patch("app.db.crud.read_user_public", wraps=crud.read_user_public) as read_user_public:
+        r = await client.patch(
+            f"{settings.API_V1_STR}/users/me",
+            headers=normal_user_token_headers,
+            json={"full_name": "Read once"},
+        )
+    assert r.status_code == 200
+    # the full user is read, without a principal lookup before it
+    read_user_public.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_update_user_not_exists(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
     data = {"full_name": "Updated_full_name"}
@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from httpx import AsyncClient
+from app.config import settings
+from app.db import crud, get_session
+from app.models import UserCreate
+from app.tests.utils import SMTPRecorder, random_lower_string
+
+
+@pytest.mark.asyncio
+async def test_create_announcement(
+    client: AsyncClient, superuser_token_headers: dict[str, str], smtp_server: SMTPRecorder
+) -> None:
+    domain = f"{await random_lower_string()}.example.com"
+    emails = [f"{await random_lower_string()}@{domain}" for _ in range(3)]
+    async for session in get_session():
+        for email in emails:
+            await crud.create_user(session=session, user_create=UserCreate(email=email, password="password123"))
+    with (
+        patch("app.config.settings.ANNOUNCEMENT_RATE_PER_SECOND", 1000),
+        patch("app.config.settings.ANNOUNCEMENT_SMTP_CONNECTIONS", 2),
+    ):
+        r = await client.post(
+            f"{settings.API_V1_STR}/utils/announcements/",
+            headers=superuser_token_headers,
+            json={"subject": "News", "message": "<p>Hello</p>", "filter": {"email_domain": domain}},
+        )
+        assert r.status_code == 202
+        announcement = r.json()
+        for _ in range(100):
+            r = await client.get(
+                f"{settings.API_V1_STR}/utils/announcements/{announcement['id']}",
+                headers=superuser_token_headers,
+            )
+            assert r.status_code == 200
+            announcement = r.json()
+            if announcement["status"] != "running":
+                break
+            await asyncio.sleep(0.05)
+    assert announcement["status"] == "done"
+    assert announcement["total"] == 3
+    assert announcement["sent"] == 3
+    assert sorted(envelope.rcpt_tos[0] for envelope in smtp_server.envelopes) == sorted(emails)
+
+
+@pytest.mark.asyncio
+async def test_create_announcement_emails_disabled(client: AsyncClient, superuser_token_headers: dict[str, str]) -> None:
+    with patch("app.config.settings.SMTP_HOST", None):
+        r = await client.post(
+            f"{settings.API_V1_STR}/utils/announcements/",
+            headers=superuser_token_headers,
+            json={"subject": "News", "message": "<p>Hello</p>"},
+        )
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_read_slow_queries(
+    client: AsyncClient, superuser_token_headers: dict[str, str], normal_user_token_headers: dict[str, str]
+) -> None:
+    r = await client.delete(f"{settings.API_V1_STR}/utils/slow-queries/", headers=superuser_token_headers)
+    assert r.status_code == 200
+    with patch("app.config.settings.SLOW_QUERY_THRESHOLD_MS", 0):
+        r = await client.get(f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers)
+        assert r.status_code == 200
+    r = await client.get(f"{settings.API_V1_STR}/utils/slow-queries/", headers=normal_user_token_headers)
+    assert r.status_code == 403
+    r = await client.get(f"{settings.API_V1_STR}/utils/slow-queries/", headers=superuser_token_headers)
+    assert r.status_code == 200
+    shapes = r.json()["data"]
+    items_page = next(shape for shape in shapes if shape["shape"].startswith("find items {owner_id: ?}"))
+    assert items_page["routes"] == {f"GET {settings.API_V1_STR}/items/": 1}
+    assert items_page["p99_ms"] >= items_page["p50_ms"]
+
+
+@pytest.mark.asyncio
+async def test_profile_request(
+    client: AsyncClient, superuser_token_headers: dict[str, str], normal_user_token_headers: dict[str, str]
+) -> None:
+    r = await client.get(f"{settings.API_V1_STR}/items/", headers={**normal_user_token_headers, "X-Profile": "1"})
+    assert r.status_code == 200
+    assert "x-profile-id" not in r.headers
+    r = await client.get(f"{settings.API_V1_STR}/items/", headers={**superuser_token_headers, "X-Profile": "1"})
+    assert r.status_code == 200
+    profile_id = r.headers["x-profile-id"]
+    r = await client.get(f"{settings.API_V1_STR}/utils/profiles/", headers=superuser_token_headers)
+    assert r.status_code == 200
+    [summary] = [profile for profile in r.json()["data"] if profile["id"] == profile_id]
+    assert summary["route"] == f"{settings.API_V1_STR}/items/"
+    assert summary["status"] == 200
+    r = await client.get(f"{settings.API_V1_STR}/utils/profiles/{profile_id}", headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.json()["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+    r = await client.get(
+        f"{settings.API_V1_STR}/utils/profiles/{profile_id}",
+        headers=superuser_token_headers,
+        params={"format": "collapsed"},
+    )
+    assert r.status_code == 200
+    for line in r.text.splitlines():
+        stack, _, microseconds = line.rpartition(" ")
+        assert stack and int(microseconds) >= 0
+    r = await client.get(f"{settings.API_V1_STR}/utils/profiles/{profile_id}", headers=normal_user_token_headers)
+    assert r.status_code == 403
+    r = await client.get(f"{settings.API_V1_STR}/utils/profiles/unknown", headers=superuser_token_headers)
+    assert r.status_code == 404
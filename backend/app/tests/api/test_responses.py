@@ -0,0 +1,16 @@
+import json
+from beanie import PydanticObjectId
+from app.api.responses import ModelResponse
+from app.models import ItemPublic, ItemsPublic
+
+
+def test_model_response_body() -> None:
+    item = ItemPublic(id=PydanticObjectId(), title="Foo", owner_id=PydanticObjectId())
+    response = ModelResponse(ItemsPublic(data=[item], count=1))
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {
+        "data": [{"title": "Foo", "description": None, "id": str(item.id), "owner_id": str(item.owner_id)}],
+        "count": 1,
+        "count_exact": True,
+        "next_cursor": None,
+    }
@@ -1,12 +1,14 @@
 import pytest
 import pytest_asyncio
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Generator
+from unittest.mock import patch
+from aiosmtpd.controller import Controller
 from httpx import AsyncClient, ASGITransport
 from motor.motor_asyncio import AsyncIOMotorClientSession
 from app.main import app
 from app.config import settings
 from app.db import get_session
-from app.tests.utils import get_superuser_token_headers, authentication_token_from_email
+from app.tests.utils import SMTPRecorder, free_port, get_superuser_token_headers, authentication_token_from_email
 
 
 '''
@@ -46,3 +48,18 @@ async def superuser_token_headers(client: AsyncClient) -> dict[str, str]:
 @pytest_asyncio.fixture(loop_scope="function")
 async def normal_user_token_headers(client: AsyncClient, session: AsyncIOMotorClientSession) -> dict[str, str]:
     return await authentication_token_from_email(client=client, email=settings.EMAIL_TEST_USER, session=session)
+
+
+@pytest.fixture
+def smtp_server() -> Generator[SMTPRecorder, None, None]:
+    recorder = SMTPRecorder()
+    controller = Controller(recorder, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    with (
+        patch("app.config.settings.SMTP_HOST", "127.0.0.1"),
+        patch("app.config.settings.SMTP_PORT", controller.port),
+        patch("app.config.settings.SMTP_TLS", False),
+        patch("app.config.settings.SMTP_USER", None),
+    ):
+        yield recorder
+    controller.stop()
@@ -0,0 +1,40 @@
+from unittest.mock import patch
+from app.core.cache import TTLCache
+
+
+def test_cache_hit_and_miss() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_cache_entries_expire() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=10)
+    with patch("app.core.cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("app.core.cache.time.monotonic", return_value=111.0):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_cache_drops_value_loaded_before_invalidation() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=60)
+    version = cache.version
+    cache.invalidate("a")
+    cache.set("a", 1, version=version)
+    assert cache.get("a") is None
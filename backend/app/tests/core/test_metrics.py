@@ -0,0 +1,44 @@
+import pytest
+from httpx import AsyncClient
+from app.config import settings
+from app.core.metrics import Registry
+
+
+def test_render_counter_and_histogram() -> None:
+    registry = Registry()
+    requests = registry.counter("requests", "Requests", ("route",))
+    requests.labels('/a"b').inc()
+    requests.labels('/a"b').inc(2)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)).labels()
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+    registry.callback("queue_depth", "Queue depth", "gauge", lambda: [((), 7)])
+    lines = registry.render().splitlines()
+    assert "# TYPE requests counter" in lines
+    assert 'requests_total{route="/a\\"b"} 3' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 3.65" in lines
+    assert "latency_seconds_count 4" in lines
+    assert "queue_depth 7" in lines
+    with pytest.raises(ValueError):
+        registry.counter("requests", "Requests again")
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: AsyncClient, normal_user_token_headers: dict[str, str]) -> None:
+    r = await client.get(f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    r = await client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = r.text.splitlines()
+    # labelled with the route template, not the requested path
+    assert any(
+        line.startswith(f'http_requests_total{{method="GET",route="{settings.API_V1_STR}/items/",status="200"}}')
+        for line in lines
+    )
+    assert any(line.startswith('mongo_command_duration_seconds_count{command="find"}') for line in lines)
+    assert any(line.startswith('password_hash_duration_seconds_count{operation="verify"}') for line in lines)
+    assert any(line.startswith("password_hash_queue_depth ") for line in lines)
@@ -0,0 +1,32 @@
+import pytest
+from app.core.ratelimit import KeyedRateLimiter, TokenBucket
+
+
+def test_token_bucket_burst_then_wait() -> None:
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    wait = bucket.try_acquire()
+    assert 0 < wait <= 0.1
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_acquire_waits() -> None:
+    bucket = TokenBucket(rate=100, capacity=1)
+    await bucket.acquire()
+    await bucket.acquire()
+    assert bucket.tokens < 1
+
+
+def test_keyed_rate_limiter() -> None:
+    limiter = KeyedRateLimiter(rate=1, capacity=1, max_keys=2)
+    assert limiter.hit("a") == 0
+    assert limiter.hit("a") > 0
+    limiter.refund("a")
+    assert limiter.hit("a") == 0
+    limiter.hit("b")
+    limiter.hit("c")
+    assert len(limiter) == 2
+    # "a" was the least recently used and got evicted with a full bucket
+    assert limiter.hit("a") == 0
+    assert (limiter.allowed, limiter.rejected) == (5, 1)
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+from fastapi import HTTPException
+from app.calibrate_bcrypt import calibrate
+from app.core import security
+from app.core.security import get_password_hash, verify_password
+
+
+@pytest.mark.asyncio
+async def test_password_hash_round_trip() -> None:
+    hashed_password = await get_password_hash("correct horse")
+    assert await verify_password("correct horse", hashed_password)
+    assert not await verify_password("wrong horse", hashed_password)
+
+
+@pytest.mark.asyncio
+async def test_password_hash_queue_full() -> None:
+    with (
+        patch("app.config.settings.PASSWORD_HASH_WORKERS", 1),
+        patch("app.config.settings.PASSWORD_HASH_MAX_QUEUE", 0),
+    ):
+        results = await asyncio.gather(
+            get_password_hash("password1"),
+            get_password_hash("password2"),
+            return_exceptions=True,
+        )
+    assert isinstance(results[0], str)
+    assert isinstance(results[1], HTTPException)
+    assert results[1].status_code == 503
+    assert results[1].headers == {"Retry-After": "1"}
+
+
+@pytest.mark.asyncio
+async def test_password_hash_cancelled_still_counts() -> None:
+    release = threading.Event()
+    with patch("app.core.security._hash", side_effect=lambda password: release.wait(5) and "hash"):
+        pending = security._pending
+        task = asyncio.create_task(get_password_hash("password"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # the pool is still hashing for the cancelled caller
+        assert security._pending == pending + 1
+        release.set()
+        for _ in range(100):
+            if security._pending == pending:
+                break
+            await asyncio.sleep(0.01)
+    assert security._pending == pending
+
+
+def test_calibrate_bcrypt() -> None:
+    recommended, timings = calibrate(budget_ms=0, max_rounds=5)
+    assert recommended == 4
+    assert list(timings) == [4]
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from pymongo import monitoring
+from app.db.monitoring import PoolMetricsListener, SlowQueryLog, command_shape
+
+
+def test_command_shape() -> None:
+    find = {
+        "find": "items",
+        "filter": {"owner_id": ObjectId(), "$or": [{"title": {"$gt": "a"}}, {"_id": {"$in": [ObjectId()]}}]},
+        "sort": {"title": 1, "_id": 1},
+        "hint": {"owner_id": 1, "title": 1, "_id": 1},
+        "limit": 100,
+    }
+    assert command_shape("find", find) == (
+        "find items {owner_id: ?, $or: [{title: {$gt: ?}}, {_id: {$in: ?}}]}"
+        " sort {title: 1, _id: 1} hint {owner_id: 1, title: 1, _id: 1}"
+    )
+    aggregate = {
+        "aggregate": "items",
+        "pipeline": [{"$match": {"owner_id": ObjectId()}}, {"$group": {"_id": 1, "n": {"$sum": 1}}}],
+    }
+    assert command_shape("aggregate", aggregate) == "aggregate items [$match {owner_id: ?}, $group]"
+    delete = {"delete": "items", "deletes": [{"q": {"owner_id": ObjectId()}, "limit": 0}]}
+    assert command_shape("delete", delete) == "delete items {owner_id: ?}"
+    assert command_shape("getMore", {"getMore": 1234, "collection": "items"}) == "getMore items"
+
+
+def test_slow_query_log() -> None:
+    log = SlowQueryLog(max_shapes=2, samples=100)
+    for duration_ms in range(1, 101):
+        log.record("find items {owner_id: ?}", duration_ms, "GET /api/v1/items/")
+    log.record("find users {email: ?}", 500, "background")
+    [slowest, items] = log.top(10)
+    assert slowest.shape == "find users {email: ?}"
+    assert items.count == 100
+    assert items.p50_ms == 50
+    assert items.p99_ms == 99
+    assert items.max_ms == 100
+    assert items.routes == {"GET /api/v1/items/": 100}
+    # the least recently seen shape makes room for a new one
+    log.record("find items {title: ?}", 1, "background")
+    assert [shape.shape for shape in log.top(10)] == ["find users {email: ?}", "find items {title: ?}"]
+    log.clear()
+    assert len(log) == 0
+
+
+def test_pool_metrics_checked_out() -> None:
+    listener = PoolMetricsListener()
+    address = ("localhost", 27017)
+
+    def checkouts(connection_id: int) -> None:
+        for _ in range(10_000):
+            listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, connection_id, 0.001))
+            listener.connection_checked_in(monitoring.ConnectionCheckedInEvent(address, connection_id))
+
+    # as from Motor's worker threads
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(checkouts, range(8)))
+    assert listener.checked_out == 0
+    listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, 1, 0.001))
+    assert listener.checked_out == 1
@@ -0,0 +1,317 @@
+"""
+Query plans of the request-time queries in app.db.crud, app.models and app.outbox.
+
+Each query shape is run through explain() against seeded data and must be answered
+from an index: no COLLSCAN, no in-memory SORT, and no more than
+MAX_DOCS_EXAMINED_PER_RETURNED documents fetched per document returned. When a query
+or an index changes, the shape here is changed with it.
+
+Background jobs that walk a whole collection on purpose (announcements, migrations)
+are not covered.
+"""
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Mapping, Optional
+from beanie import PydanticObjectId
+from beanie.odm.utils.projection import get_projection
+from motor.motor_asyncio import AsyncIOMotorClientSession
+from pymongo import ASCENDING
+from app.db import crud
+from app.models import (
+    EmailOutbox,
+    Item,
+    ItemCreate,
+    ItemPublic,
+    ItemsFilter,
+    ItemsSelection,
+    ItemsSort,
+    User,
+    UserPublic,
+)
+from app.outbox import claim_arguments
+from app.tests.utils import create_random_user, random_lower_string
+
+
+# Residual filters (e.g. has_description) fetch a few documents per match
+MAX_DOCS_EXAMINED_PER_RETURNED = 3
+ITEMS_PER_OWNER = 120
+PAGE_SIZE = 20
+WORDS = ["apple", "banana", "cherry", "damson", "elder"]
+SORTS: list[ItemsSort] = ["id", "-id", "title", "-title"]
+
+
+class Seed:
+    def __init__(self, owner: User, other: User, tag: str, items: list[Item]) -> None:
+        self.owner = owner
+        self.other = other
+        # unique to this seed, so unscoped queries can be narrowed to its items
+        self.tag = tag
+        self.items = items
+
+
+@pytest_asyncio.fixture(loop_scope="function")
+async def seed(session: AsyncIOMotorClientSession) -> Seed:
+    owner = await create_random_user(session)
+    other = await create_random_user(session)
+    tag = (await random_lower_string())[:8]
+    for user in (owner, other):
+        items_in = [
+            ItemCreate(
+                title=f"{tag}{WORDS[i % len(WORDS)]} {i:03d}",
+                description=f"{tag}needle" if i % 10 == 0 else ("lorem ipsum" if i % 2 == 0 else None),
+            )
+            for i in range(ITEMS_PER_OWNER)
+        ]
+        await crud.create_items(session=session, user=user, items_in=items_in)
+    items = await Item.find(Item.owner_id == owner.id).sort(+Item.id).to_list()
+    return Seed(owner, other, tag, items)
+
+
+async def explain(command: dict[str, Any]) -> dict[str, Any]:
+    database = Item.get_motor_collection().database
+    return await database.command("explain", command, verbosity="executionStats")
+
+
+def plan_stages(plan: dict[str, Any]) -> list[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan", "thenStage", "elseStage", "outerStage", "innerStage"):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for input_stage in plan.get("inputStages", []):
+        stages += plan_stages(input_stage)
+    return stages
+
+
+def query_explains(result: dict[str, Any]) -> list[dict[str, Any]]:
+    """
+    The query layer parts of an explain, at the top level or under an aggregation's $cursor
+    """
+    if "queryPlanner" in result:
+        return [result]
+    return [stage["$cursor"] for stage in result.get("stages", []) if "$cursor" in stage]
+
+
+def docs_returned(stats: dict[str, Any]) -> int:
+    # writes report what they would have matched instead of returning documents
+    stages = stats.get("executionStages", {})
+    return stats.get("nReturned") or stages.get("nWouldDelete") or stages.get("nMatched") or 0
+
+
+def assert_indexed(result: dict[str, Any], *, sort: bool = False, ratio: bool = True) -> None:
+    """
+    Fail on a collection scan, an in-memory sort unless sort, or too many documents
+    examined per document returned unless not ratio
+    """
+    explains = query_explains(result)
+    assert explains, result
+    for part in explains:
+        stages = plan_stages(part["queryPlanner"]["winningPlan"])
+        assert "COLLSCAN" not in stages, stages
+        if not sort:
+            assert "SORT" not in stages, stages
+        stats = part.get("executionStats") or result["executionStats"]
+        if ratio:
+            examined, returned = stats["totalDocsExamined"], docs_returned(stats)
+            assert examined <= MAX_DOCS_EXAMINED_PER_RETURNED * max(returned, 1), (examined, returned, stages)
+
+
+def find_command(
+    collection: str,
+    filter: Mapping[str, Any],
+    sort: Optional[list[tuple[str, int]]] = None,
+    limit: int = 0,
+    hint: Optional[list[tuple[str, int]]] = None,
+    projection: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    command: dict[str, Any] = {"find": collection, "filter": filter}
+    if sort:
+        command["sort"] = dict(sort)
+    if limit:
+        command["limit"] = limit
+    if hint:
+        command["hint"] = dict(hint)
+    if projection:
+        command["projection"] = projection
+    return command
+
+
+def count_command(collection: str, filter: dict[str, Any]) -> dict[str, Any]:
+    # the pipeline pymongo's count_documents runs
+    pipeline = [{"$match": filter}, {"$group": {"_id": 1, "n": {"$sum": 1}}}]
+    return {"aggregate": collection, "pipeline": pipeline, "cursor": {}}
+
+
+def sort_key_values(item: Item, sort: ItemsSort) -> list[Any]:
+    return [item.id] if sort in ("id", "-id") else [item.title, item.id]
+
+
+def read_items_command(
+    sort: ItemsSort,
+    owner_id: Optional[PydanticObjectId],
+    items_filter: Optional[ItemsFilter],
+    after: Optional[list[Any]] = None,
+) -> dict[str, Any]:
+    """
+    The page query of crud.read_items
+    """
+    filter = crud.items_filter_query(items_filter) if items_filter is not None else {}
+    if owner_id is not None:
+        filter["owner_id"] = owner_id
+    if after is not None:
+        keyset = crud.items_keyset_query(sort, after)
+        filter = {"$and": [filter, keyset]} if filter else keyset
+    return find_command(
+        "items",
+        filter,
+        sort=crud.items_sort_keys(sort),
+        limit=PAGE_SIZE,
+        hint=crud.items_sort_index(sort, owner_id, items_filter),
+        projection=get_projection(ItemPublic),
+    )
+
+
+@pytest.mark.asyncio
+async def test_plan_read_user_by_email(seed: Seed) -> None:
+    filter = User.find_one(User.email == seed.owner.email).get_filter_query()
+    assert_indexed(await explain(find_command("users", filter, limit=1)))
+
+
+@pytest.mark.asyncio
+async def test_plan_read_user_by_id(seed: Seed) -> None:
+    filter = User.find_one(User.id == seed.owner.id).get_filter_query()
+    assert_indexed(await explain(find_command("users", filter, limit=1, projection=get_projection(UserPublic))))
+
+
+@pytest.mark.asyncio
+async def test_plan_read_users(seed: Seed) -> None:
+    for filter in ({}, {"_id": {"$gt": seed.owner.id}}):
+        command = find_command("users", filter, sort=[("_id", ASCENDING)], limit=PAGE_SIZE)
+        assert_indexed(await explain(command))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sort", SORTS)
+@pytest.mark.parametrize("scoped", [True, False])
+async def test_plan_read_items(seed: Seed, sort: ItemsSort, scoped: bool) -> None:
+    owner_id = seed.owner.id if scoped else None
+    result = await explain(read_items_command(sort, owner_id, None))
+    assert_indexed(result)
+    assert docs_returned(result["executionStats"]) == PAGE_SIZE
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sort", SORTS)
+async def test_plan_read_items_keyset(seed: Seed, sort: ItemsSort) -> None:
+    ordered = sorted(seed.items, key=lambda item: sort_key_values(item, sort), reverse=sort.startswith("-"))
+    after = sort_key_values(ordered[PAGE_SIZE - 1], sort)
+    for owner_id in (seed.owner.id, None):
+        assert_indexed(await explain(read_items_command(sort, owner_id, None, after)))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "sort,items_filter",
+    [
+        ("title", ItemsFilter(title_prefix=WORDS[0])),
+        ("-title", ItemsFilter(title_prefix=WORDS[0])),
+        ("title", ItemsFilter(title=f"{WORDS[1]} 001")),
+        # a title_prefix with an id sort has no index and is rejected by the route
+        ("id", ItemsFilter(title=f"{WORDS[1]} 001")),
+        ("id", ItemsFilter(has_description=True)),
+        ("-title", ItemsFilter(has_description=False)),
+        ("id", ItemsFilter(id_gte=PydanticObjectId("000000000000000000000000"))),
+    ],
+)
+async def test_plan_read_items_filtered(seed: Seed, sort: ItemsSort, items_filter: ItemsFilter) -> None:
+    # filters on title are relative to the seed's tag, so they match its items only
+    if items_filter.title_prefix is not None:
+        items_filter = items_filter.model_copy(update={"title_prefix": seed.tag + items_filter.title_prefix})
+    if items_filter.title is not None:
+        items_filter = items_filter.model_copy(update={"title": seed.tag + items_filter.title})
+    result = await explain(read_items_command(sort, seed.owner.id, items_filter))
+    assert_indexed(result)
+    assert docs_returned(result["executionStats"]) > 0
+    if items_filter.title_prefix is not None:
+        assert_indexed(await explain(read_items_command(sort, None, items_filter)))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "items_filter",
+    [None, ItemsFilter(title_prefix=WORDS[0]), ItemsFilter(has_description=True)],
+)
+async def test_plan_count_items(seed: Seed, items_filter: Optional[ItemsFilter]) -> None:
+    filter = crud.items_filter_query(items_filter) if items_filter is not None else {}
+    filter["owner_id"] = seed.owner.id
+    # a count returns one document, only the index use is checked
+    assert_indexed(await explain(count_command("items", filter)), ratio=False)
+
+
+@pytest.mark.asyncio
+async def test_plan_read_item(seed: Seed) -> None:
+    filter = Item.find_one(Item.id == seed.items[0].id).get_filter_query()
+    assert_indexed(await explain(find_command("items", filter, limit=1, projection=get_projection(ItemPublic))))
+
+
+@pytest.mark.asyncio
+async def test_plan_iter_items_public(seed: Seed) -> None:
+    command = find_command("items", {"owner_id": seed.owner.id}, sort=[("_id", ASCENDING)])
+    assert_indexed(await explain(command))
+
+
+@pytest.mark.asyncio
+async def test_plan_search_items(seed: Seed) -> None:
+    pipeline = [
+        {"$match": {"$text": {"$search": f"{seed.tag}needle"}, "owner_id": seed.owner.id}},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$limit": PAGE_SIZE},
+    ]
+    # relevance is only known once every match is scored, so that sort is in memory
+    result = await explain({"aggregate": "items", "pipeline": pipeline, "cursor": {}})
+    assert_indexed(result, sort=True, ratio=False)
+    stages = [stage for part in query_explains(result) for stage in plan_stages(part["queryPlanner"]["winningPlan"])]
+    assert "TEXT_MATCH" in stages or "TEXT_OR" in stages, stages
+
+
+@pytest.mark.asyncio
+async def test_plan_update_and_delete_items(seed: Seed) -> None:
+    selection = ItemsSelection(ids=[item.id for item in seed.items[:PAGE_SIZE]])
+    query = crud.items_selection_query(selection, owner_id=seed.owner.id)
+    update = {"q": query, "u": {"$set": {"title": "updated"}, "$inc": {"version": 1}}, "multi": True}
+    assert_indexed(await explain({"update": "items", "updates": [update]}))
+    assert_indexed(await explain({"delete": "items", "deletes": [{"q": query, "limit": 0}]}))
+
+
+@pytest.mark.asyncio
+async def test_plan_cascade_delete(seed: Seed) -> None:
+    # User.cascade_delete
+    query = Item.find(Item.owner_id == seed.owner.id).get_filter_query()
+    assert_indexed(await explain({"delete": "items", "deletes": [{"q": query, "limit": 0}]}))
+
+
+@pytest.mark.asyncio
+async def test_plan_outbox_claim(seed: Seed) -> None:
+    now = datetime.now(timezone.utc)
+    await EmailOutbox.insert_many([
+        EmailOutbox(
+            email_to=seed.owner.email,
+            subject="Hello",
+            html_content="<p>Hello</p>",
+            status=status,
+            next_attempt_at=now - timedelta(seconds=1),
+        )
+        # already sent or dead, so a worker running meanwhile skips them although they are due
+        for status in ("sent", "dead")
+    ])
+    claim = claim_arguments(now)
+    command = {
+        "findAndModify": "email_outbox",
+        "query": claim["filter"],
+        "sort": dict(claim["sort"]),
+        "update": claim["update"],
+        "new": True,
+    }
+    # merging the index ranges of each status keeps next_attempt_at order without a SORT
+    assert_indexed(await explain(command), ratio=False)
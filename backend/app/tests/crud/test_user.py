@@ -1,9 +1,12 @@
+import asyncio
 import pytest
+from beanie import PydanticObjectId
 from fastapi.encoders import jsonable_encoder
 from motor.motor_asyncio import AsyncIOMotorClientSession
 from app.db import crud
-from app.models import UserCreate, UserUpdate
-from app.core.security import verify_password
+from app.db.migrations import drop_user_items
+from app.models import User, UserCreate, UserPublic, UserUpdate
+from app.core.security import password_needs_update, pwd_context, verify_password
 from app.tests.utils import random_email, random_lower_string
 
 @pytest.mark.asyncio
@@ -27,6 +30,22 @@ async def test_authenticate_user(session: AsyncIOMotorClientSession) -> None:
     assert user.email == authenticated_user.email
 
 
+@pytest.mark.asyncio
+async def test_authenticate_user_rehashes_outdated_hash(session: AsyncIOMotorClientSession) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    user = await crud.create_user(session=session, user_create=UserCreate(email=email, password=password))
+    outdated_hash = pwd_context.hash(password, rounds=4)
+    await user.set({User.hashed_password: outdated_hash})
+    assert await password_needs_update(outdated_hash)
+    assert await crud.authenticate(session=session, email=email, password=password)
+    await asyncio.gather(*crud._rehash_tasks)
+    user = await crud.read_user_by_id(session=session, id=user.id)
+    assert user.hashed_password != outdated_hash
+    assert not await password_needs_update(user.hashed_password)
+    assert await verify_password(password, user.hashed_password)
+
+
 @pytest.mark.asyncio
 async def test_not_authenticate_user(session: AsyncIOMotorClientSession) -> None:
     email = await random_email()
@@ -97,3 +116,31 @@ async def test_update_user(session: AsyncIOMotorClientSession) -> None:
     assert user_2
     assert user.email == user_2.email
     assert await verify_password(new_password, user_2.hashed_password)
+
+
+@pytest.mark.asyncio
+async def test_read_user_public(session: AsyncIOMotorClientSession) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    user_in = UserCreate(email=email, password=password, full_name="Public Name")
+    user = await crud.create_user(session=session, user_create=user_in)
+    user_public = await crud.read_user_public(session=session, id=user.id)
+    assert isinstance(user_public, UserPublic)
+    assert user_public.id == user.id
+    assert user_public.email == email
+    assert user_public.full_name == "Public Name"
+    assert not hasattr(user_public, "hashed_password")
+
+
+@pytest.mark.asyncio
+async def test_drop_user_items(session: AsyncIOMotorClientSession) -> None:
+    email = await random_email()
+    password = await random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = await crud.create_user(session=session, user_create=user_in)
+    collection = User.get_motor_collection()
+    await collection.update_one({"_id": user.id}, {"$set": {"items": [PydanticObjectId()]}})
+    await drop_user_items(batch_size=1)
+    raw_user = await collection.find_one({"_id": user.id})
+    assert "items" not in raw_user
+    assert await crud.read_user_by_id(session=session, id=user.id)
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from app.announcements import fail_interrupted_announcements, start_announcement
+from app.db import crud, get_session
+from app.models import Announcement, UserCreate, UsersFilter
+from app.tests.utils import random_email, random_lower_string
+
+
+@pytest.mark.asyncio
+async def test_run_announcement_sender_failure() -> None:
+    async for session in get_session():
+        await crud.create_user(session=session, user_create=UserCreate(email=await random_email(), password="password123"))
+    announcement = Announcement(subject="News", message="<p>Hello</p>", filter=UsersFilter(is_active=None))
+    with (
+        patch("app.config.settings.ANNOUNCEMENT_BATCH_SIZE", 1),
+        patch("app.config.settings.ANNOUNCEMENT_SMTP_CONNECTIONS", 1),
+        patch("app.announcements._send", side_effect=RuntimeError("boom")),
+    ):
+        # a dead sender used to leave the producer blocked on the full queue
+        await asyncio.wait_for(await start_announcement(announcement), 5)
+    failed = await Announcement.get(announcement.id)
+    assert failed
+    assert failed.status == "failed"
+    assert failed.error == "RuntimeError('boom')"
+    assert failed.finished_at
+
+
+@pytest.mark.asyncio
+async def test_run_announcement_renews_lease() -> None:
+    announcement = Announcement(subject="News", message="<p>Hello</p>", filter=UsersFilter(email_domain="nobody.invalid"))
+    leased_until = None
+
+    async def slow_producer(*args: object) -> None:
+        nonlocal leased_until
+        await asyncio.sleep(0.2)
+        running = await Announcement.get(announcement.id)
+        assert running
+        leased_until = running.lease_until
+
+    with (
+        patch("app.config.settings.ANNOUNCEMENT_LEASE_SECONDS", 0.15),
+        patch("app.config.settings.ANNOUNCEMENT_SMTP_CONNECTIONS", 0),
+        patch("app.announcements._producer", slow_producer),
+    ):
+        task = await start_announcement(announcement)
+        inserted_until = announcement.lease_until
+        await asyncio.wait_for(task, 5)
+    assert inserted_until and leased_until
+    assert leased_until.replace(tzinfo=timezone.utc) > inserted_until
+    done = await Announcement.get(announcement.id)
+    assert done
+    assert done.status == "done"
+
+
+@pytest.mark.asyncio
+async def test_fail_interrupted_announcements() -> None:
+    now = datetime.now(timezone.utc)
+    expired = Announcement(
+        subject=await random_lower_string(), message="<p>Hello</p>", runner_id="gone", lease_until=now - timedelta(seconds=1)
+    )
+    # still renewed by another live process
+    leased = Announcement(
+        subject=await random_lower_string(), message="<p>Hello</p>", runner_id="other", lease_until=now + timedelta(minutes=1)
+    )
+    done = Announcement(subject=await random_lower_string(), message="<p>Hello</p>", status="done")
+    await Announcement.insert_many([expired, leased, done])
+    assert await fail_interrupted_announcements() >= 1
+    interrupted = await Announcement.get(expired.id)
+    assert interrupted
+    assert interrupted.status == "failed"
+    for announcement, status in ((leased, "running"), (done, "done")):
+        unchanged = await Announcement.get(announcement.id)
+        assert unchanged
+        assert unchanged.status == status
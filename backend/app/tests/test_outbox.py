@@ -0,0 +1,53 @@
+import pytest
+from unittest.mock import patch
+from app.models import EmailOutbox
+from app.outbox import OutboxWorker
+from app.utils import send_email
+from app.tests.utils import SMTPRecorder, free_port, random_email
+
+
+@pytest.mark.asyncio
+async def test_outbox_delivers_over_one_connection(smtp_server: SMTPRecorder) -> None:
+    emails_to = [await random_email(), await random_email()]
+    for email_to in emails_to:
+        await send_email(email_to=email_to, subject="Hello", html_content="<p>Hello</p>")
+    worker = OutboxWorker()
+    assert await worker.deliver_due() >= 2
+    await worker.stop()
+    peers = {
+        peer for envelope, peer in zip(smtp_server.envelopes, smtp_server.peers)
+        if envelope.rcpt_tos[0] in emails_to
+    }
+    assert len(peers) == 1
+    for email_to in emails_to:
+        email = await EmailOutbox.find_one(EmailOutbox.email_to == email_to)
+        assert email
+        assert email.status == "sent"
+        assert email.attempts == 1
+        assert email.html_content is None
+        assert email.expires_at
+
+
+@pytest.mark.asyncio
+async def test_outbox_retries_then_dead_letters() -> None:
+    with (
+        patch("app.config.settings.SMTP_HOST", "127.0.0.1"),
+        patch("app.config.settings.SMTP_PORT", free_port()),
+        patch("app.config.settings.SMTP_TLS", False),
+        patch("app.config.settings.EMAIL_OUTBOX_MAX_ATTEMPTS", 2),
+    ):
+        email = await send_email(email_to=await random_email(), subject="Hello", html_content="<p>Hello</p>")
+        worker = OutboxWorker()
+        await worker.deliver_due()
+        email = await EmailOutbox.get(email.id)
+        assert email.status == "queued"
+        assert email.attempts == 1
+        assert email.last_error
+        # Make the retry due now instead of after the backoff
+        await email.set({"next_attempt_at": email.created_at})
+        await worker.deliver_due()
+        email = await EmailOutbox.get(email.id)
+        assert email.status == "dead"
+        assert email.attempts == 2
+        assert email.html_content == "<p>Hello</p>"
+        assert email.expires_at
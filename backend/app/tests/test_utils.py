@@ -0,0 +1,17 @@
+import pytest
+from unittest.mock import patch
+from jinja2 import FileSystemLoader
+from app.utils import email_templates, load_email_templates, render_email_template
+
+
+@pytest.mark.asyncio
+async def test_render_email_template_from_memory() -> None:
+    await load_email_templates()
+    with (
+        patch.object(email_templates, "auto_reload", False),
+        patch.object(FileSystemLoader, "get_source", side_effect=AssertionError("template read from disk")),
+    ):
+        html_content = await render_email_template(
+            template_name="test_email.html", context={"project_name": "Project", "email": "a@example.com"}
+        )
+    assert "a@example.com" in html_content
@@ -1,4 +1,5 @@
 import random
+import socket
 import string
 from motor.motor_asyncio import AsyncIOMotorClientSession
 from httpx import AsyncClient
@@ -71,3 +72,19 @@ async def get_superuser_token_headers(client: AsyncClient) -> dict[str, str]:
     headers = {"Authorization": f"Bearer {a_token}"}
     return headers
 
+
+class SMTPRecorder:
+    def __init__(self) -> None:
+        self.envelopes: list = []
+        self.peers: list = []
+
+    async def handle_DATA(self, server, session, envelope) -> str:
+        self.envelopes.append(envelope)
+        self.peers.append(session.peer)
+        return "250 Message accepted for delivery"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
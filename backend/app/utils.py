@@ -1,13 +1,15 @@
-import logging
-import emails  # type: ignore
+import base64
+import json
 import jwt
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any
-from jinja2 import Template
+from typing import Any, Optional
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from jwt.exceptions import InvalidTokenError
 from app.config import settings
+from app.models import EmailOutbox
+from app.outbox import outbox_worker
 
 
 @dataclass
@@ -16,30 +18,37 @@ class EmailData:
     subject: str
 
 
+# Compiled templates are kept in memory and their bytecode on disk for the next process.
+# Outside local development templates are never checked for changes after loading.
+email_templates = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "email-templates" / "build"),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=settings.ENVIRONMENT == "local",
+)
+
+
+async def load_email_templates() -> None:
+    """
+    Compile every email template up front, called at startup
+    """
+    for template_name in email_templates.list_templates(extensions=["html"]):
+        email_templates.get_template(template_name)
+
+
 async def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name).read_text()
-    html_content = Template(template_str).render(context)
+    html_content = email_templates.get_template(template_name).render(context)
     return html_content
 
 
-async def send_email(*, email_to: str, subject: str = "", html_content: str = "") -> None:
+async def send_email(*, email_to: str, subject: str = "", html_content: str = "") -> EmailOutbox:
+    """
+    Queue an email in the outbox and return; the outbox worker delivers it over SMTP.
+    """
     assert settings.emails_enabled, "no provided configuration for email variables"
-    message = emails.Message(
-        subject=subject,
-        html=html_content,
-        mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL))
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
-    if settings.SMTP_TLS:
-        smtp_options["tls"] = True
-    elif settings.SMTP_SSL:
-        smtp_options["ssl"] = True
-    if settings.SMTP_USER:
-        smtp_options["user"] = settings.SMTP_USER
-    if settings.SMTP_PASSWORD:
-        smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
-    logging.info(f"send email result: {response}")
+    email = EmailOutbox(email_to=email_to, subject=subject, html_content=html_content)
+    await email.insert()
+    outbox_worker.notify()
+    return email
 
 
 async def generate_test_email(email_to: str) -> EmailData:
@@ -104,3 +113,22 @@ async def verify_password_reset_token(token: str) -> str | None:
         return str(decoded_token["sub"])
     except InvalidTokenError:
         return None
+
+
+async def encode_cursor(*values: Any) -> str:
+    """
+    Opaque pagination cursor for the sort key values of the last row of a page
+    """
+    raw = json.dumps([str(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+async def decode_cursor(cursor: str) -> Optional[list[str]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        return None
+    return values
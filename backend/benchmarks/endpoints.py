@@ -0,0 +1,256 @@
+"""
+Latency and throughput of the main API endpoints, with a stored baseline to catch regressions.
+
+Drives app.main.app in process through httpx.ASGITransport, against one database per
+dataset size (DB_DATABASE + "_bench_<size>"), each seeded once with that many items and
+1 user per 100 items. For every size and endpoint it records throughput and p50/p95/p99,
+compares them with the baseline and exits with status 1 when an endpoint got slower than
+the tolerance allows. --update-baseline stores the run as the new baseline instead.
+
+    $ python -m benchmarks.endpoints --sizes 1000,100000,1000000
+    $ python -m benchmarks.endpoints --sizes 1000 --update-baseline
+
+Baselines are only comparable on the same machine and database, so record them there.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+from bson import DBRef
+from httpx import ASGITransport, AsyncClient, Response
+from app.config import settings
+from app.core.cache import principal_cache
+from app.db import connect, crud, disconnect, get_session, init_db
+from app.main import app
+from app.models import Item, User, UserCreate
+
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "benchpassword"
+SEED_BATCH_SIZE = 10_000
+PAGE_SIZE = 100
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+Request = Callable[[AsyncClient, int], Awaitable[Response]]
+
+
+async def seed(size: int) -> None:
+    """
+    The bench user, size // 100 users sharing its password hash, and size items spread over them
+    """
+    async for session in get_session():
+        await init_db(session=session)
+        bench_user = await crud.read_user_by_email(session=session, email=BENCH_EMAIL)
+        if bench_user is None:
+            bench_user = await crud.create_user(
+                session=session, user_create=UserCreate(email=BENCH_EMAIL, password=BENCH_PASSWORD)
+            )
+    users = User.get_motor_collection()
+    existing_users = await users.estimated_document_count()
+    for start in range(existing_users, max(size // 100, 10), SEED_BATCH_SIZE):
+        await users.insert_many([
+            {
+                "email": f"user{n}@bench.example.com",
+                "is_active": True,
+                "is_superuser": False,
+                "full_name": f"User {n}",
+                "hashed_password": bench_user.hashed_password,
+                "version": 0,
+            }
+            for n in range(start, min(start + SEED_BATCH_SIZE, max(size // 100, 10)))
+        ], ordered=False)
+    owner_ids = await users.distinct("_id")
+    items = Item.get_motor_collection()
+    rng = random.Random(size)
+    for start in range(await items.estimated_document_count(), size, SEED_BATCH_SIZE):
+        batch = []
+        for n in range(start, min(start + SEED_BATCH_SIZE, size)):
+            owner_id = rng.choice(owner_ids)
+            batch.append({
+                "title": f"Item {n}",
+                "description": f"Description of item {n}" if n % 2 else None,
+                "owner_id": owner_id,
+                "owner": DBRef("users", owner_id),
+                "version": 0,
+            })
+        await items.insert_many(batch, ordered=False)
+        print(f"seeded {start + len(batch)}/{size} items", end="\r", flush=True)
+    print()
+
+
+async def headers(client: AsyncClient, email: str, password: str) -> dict[str, str]:
+    r = await client.post(f"{settings.API_V1_STR}/login/access-token", data={"username": email, "password": password})
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+async def endpoints(client: AsyncClient, size: int, requests: int) -> dict[str, tuple[Request, int]]:
+    """
+    Endpoint name -> (a function sending its i-th request, number of requests)
+    """
+    api = settings.API_V1_STR
+    superuser = await headers(client, settings.FIRST_SUPERUSER, settings.FIRST_SUPERUSER_PASSWORD)
+    deep_skip = max(size // 2 - PAGE_SIZE, 0)
+    r = await client.get(f"{api}/items/", headers=superuser, params={"skip": deep_skip, "limit": PAGE_SIZE})
+    r.raise_for_status()
+    deep_cursor = r.json()["next_cursor"]
+    item_ids = [str(item["_id"]) async for item in Item.get_motor_collection().aggregate([{"$sample": {"size": 1000}}])]
+    # create_item makes the items that update_item and delete_item then work on
+    created: list[str] = []
+
+    async def login(client: AsyncClient, i: int) -> Response:
+        return await client.post(f"{api}/login/access-token", data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD})
+
+    async def read_items_first_page(client: AsyncClient, i: int) -> Response:
+        return await client.get(f"{api}/items/", headers=superuser, params={"limit": PAGE_SIZE})
+
+    async def read_items_deep_skip(client: AsyncClient, i: int) -> Response:
+        return await client.get(f"{api}/items/", headers=superuser, params={"skip": deep_skip, "limit": PAGE_SIZE})
+
+    async def read_items_deep_cursor(client: AsyncClient, i: int) -> Response:
+        return await client.get(f"{api}/items/", headers=superuser, params={"cursor": deep_cursor, "limit": PAGE_SIZE})
+
+    async def read_item(client: AsyncClient, i: int) -> Response:
+        return await client.get(f"{api}/items/{item_ids[i % len(item_ids)]}", headers=superuser)
+
+    async def create_item(client: AsyncClient, i: int) -> Response:
+        r = await client.post(f"{api}/items/", headers=superuser, json={"title": f"Bench {i}", "description": "Bench"})
+        # a failure is reported by run() with its response body
+        if r.status_code < 400:
+            created.append(r.json()["id"])
+        return r
+
+    async def update_item(client: AsyncClient, i: int) -> Response:
+        return await client.put(f"{api}/items/{created[i]}", headers=superuser, json={"title": f"Bench {i} updated"})
+
+    async def delete_item(client: AsyncClient, i: int) -> Response:
+        return await client.delete(f"{api}/items/{created[i]}", headers=superuser)
+
+    async def read_users(client: AsyncClient, i: int) -> Response:
+        return await client.get(f"{api}/users/", headers=superuser, params={"limit": PAGE_SIZE})
+
+    # login is bound by bcrypt, so it gets fewer requests
+    return {
+        "login": (login, max(requests // 10, 10)),
+        "read_items_first_page": (read_items_first_page, requests),
+        "read_items_deep_skip": (read_items_deep_skip, requests),
+        "read_items_deep_cursor": (read_items_deep_cursor, requests),
+        "read_item": (read_item, requests),
+        "create_item": (create_item, requests),
+        "update_item": (update_item, requests),
+        "delete_item": (delete_item, requests),
+        "read_users": (read_users, requests),
+    }
+
+
+def percentile(timings: list[float], p: float) -> float:
+    return statistics.quantiles(timings, n=100, method="inclusive")[int(p) - 1]
+
+
+async def run(client: AsyncClient, request: Request, requests: int, concurrency: int) -> dict[str, float]:
+    """
+    Send requests requests from concurrency workers; throughput in requests per second, latencies in ms
+    """
+    timings: list[float] = []
+    next_request = iter(range(requests))
+
+    async def worker() -> None:
+        for i in next_request:
+            start = time.perf_counter()
+            r = await request(client, i)
+            timings.append((time.perf_counter() - start) * 1000)
+            if r.status_code >= 400:
+                raise RuntimeError(f"{r.request.method} {r.request.url} returned {r.status_code}: {r.text}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "p99_ms": round(percentile(timings, 99), 2),
+    }
+
+
+def regressions(
+    results: dict[str, dict[str, dict[str, float]]],
+    baseline: dict[str, dict[str, dict[str, float]]],
+    tolerance: float,
+) -> list[str]:
+    """
+    Endpoints whose p95 grew, or whose throughput shrank, by more than tolerance (0.2 = 20%)
+    """
+    found = []
+    for size, by_endpoint in results.items():
+        for endpoint, result in by_endpoint.items():
+            base = baseline.get(size, {}).get(endpoint)
+            if base is None:
+                continue
+            if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                found.append(f"{endpoint} at {size} items: p95 {base['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+            if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+                found.append(
+                    f"{endpoint} at {size} items: throughput "
+                    f"{base['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s"
+                )
+    return found
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="comma-separated numbers of items")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=10, help="requests per read endpoint before measuring")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    # the benchmark logs in far more often than the login throttle allows
+    settings.LOGIN_RATE_LIMIT_ENABLED = False
+    database = settings.DB_DATABASE
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    print(f"{'endpoint':<26}{'items':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        settings.DB_DATABASE = f"{database}_bench_{size}"
+        principal_cache.clear()
+        await connect()
+        try:
+            await seed(size)
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+                for endpoint, (request, requests) in (await endpoints(client, size, args.requests)).items():
+                    if endpoint.startswith(("read_", "login")):
+                        await run(client, request, min(args.warmup, requests), args.concurrency)
+                    result = await run(client, request, requests, args.concurrency)
+                    results.setdefault(str(size), {})[endpoint] = result
+                    print(
+                        f"{endpoint:<26}{size:>9}{result['throughput_rps']:>10.1f}"
+                        f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                    )
+        finally:
+            await disconnect()
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, run with --update-baseline to record one")
+        return 0
+    found = regressions(results, json.loads(args.baseline.read_text()), args.tolerance)
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
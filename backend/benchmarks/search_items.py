@@ -0,0 +1,110 @@
+"""
+Latency of crud.search_items on a large items collection.
+
+Seeds a separate database (DB_DATABASE + "_bench" unless --database is given) with
+--items synthetic items, once, then times searches for common, medium and rare words,
+over all items and scoped to one owner, first and second page.
+
+    $ python -m benchmarks.search_items --items 1000000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from bson import DBRef, ObjectId
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.config import settings
+from app.db import crud
+from app.models import Item, User
+
+
+VOCABULARY_SIZE = 20_000
+SEED_BATCH_SIZE = 10_000
+
+
+def vocabulary() -> tuple[list[str], list[float]]:
+    """
+    Synthetic words with Zipf-like frequencies, so they range from very common to rare
+    """
+    rng = random.Random(0)
+    words = ["".join(rng.choices("bcdfghjklmnpqrstvwxz", k=3)) + f"{rank:05d}" for rank in range(VOCABULARY_SIZE)]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+    return words, weights
+
+
+async def seed(items: int, owners: int) -> list[ObjectId]:
+    collection = Item.get_motor_collection()
+    owner_ids = [ObjectId() for _ in range(owners)]
+    existing = await collection.estimated_document_count()
+    words, weights = vocabulary()
+    rng = random.Random(1)
+    for start in range(existing, items, SEED_BATCH_SIZE):
+        batch = []
+        for _ in range(min(SEED_BATCH_SIZE, items - start)):
+            owner_id = rng.choice(owner_ids)
+            batch.append({
+                "title": " ".join(rng.choices(words, weights, k=rng.randint(2, 6))),
+                "description": " ".join(rng.choices(words, weights, k=rng.randint(10, 40))),
+                "owner_id": owner_id,
+                "owner": DBRef("users", owner_id),
+                "version": 0,
+            })
+        await collection.insert_many(batch, ordered=False)
+        print(f"seeded {start + len(batch)}/{items}", end="\r", flush=True)
+    print()
+    return await collection.distinct("owner_id")
+
+
+async def time_search(runs: int, **kwargs) -> tuple[list[float], int]:
+    timings = []
+    results = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        found = await crud.search_items(session=None, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+        results = len(found)
+    return timings, results
+
+
+def percentile(timings: list[float], p: float) -> float:
+    return statistics.quantiles(timings, n=100, method="inclusive")[int(p) - 1]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--owners", type=int, default=1_000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--database", default=f"{settings.DB_DATABASE}_bench")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.DB_URL)
+    await init_beanie(database=client[args.database], document_models=[Item, User])
+    owner_ids = await seed(args.items, args.owners)
+    owner_id = owner_ids[0]
+    words, _ = vocabulary()
+
+    print(f"{'query':<28}{'scope':<8}{'page':<6}{'results':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, rank in (("common", 10), ("medium", 1_000), ("rare", VOCABULARY_SIZE - 10)):
+        q = words[rank]
+        for scope, scope_owner_id in (("all", None), ("owner", owner_id)):
+            first_page = await crud.search_items(session=None, q=q, owner_id=scope_owner_id, limit=args.limit)
+            pages = [("1", None)]
+            if len(first_page) == args.limit:
+                pages.append(("2", (first_page[-1].score, first_page[-1].id)))
+            for page, after in pages:
+                timings, results = await time_search(
+                    args.runs, q=q, owner_id=scope_owner_id, limit=args.limit, after=after
+                )
+                print(
+                    f"{label + ' (' + q + ')':<28}{scope:<8}{page:<6}{results:>8}"
+                    f"{percentile(timings, 50):>10.1f}{percentile(timings, 95):>10.1f}{percentile(timings, 99):>10.1f}"
+                )
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())